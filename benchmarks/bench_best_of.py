@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Best-of-N overhead benchmark
+
+Times, for several candidate counts, plain generation of that many chains
+with generate_batch against best-of-N selection of one of them with
+synopsis_scoring.best_walks, and prints the overhead of scoring. Both draw
+the same chains; best-of-N additionally scores them and converts only the
+winner to a list.
+
+Usage:
+    python benchmarks/bench_best_of.py [--megabytes 5] [--order 2] [--candidates 16 64 256]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synopsis_scoring  # noqa: E402
+from book_synopsis_generator import BookSynopsisGenerator, batch_rng  # noqa: E402
+from synthetic import synthetic_corpus  # noqa: E402
+
+
+def main():
+    """Run the overhead benchmark and print the time per batch."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--megabytes', type=float, default=5)
+    parser.add_argument('--order', type=int, default=2)
+    parser.add_argument('--candidates', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--max-length', type=int, default=100)
+    parser.add_argument('--min-length', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    generator = BookSynopsisGenerator(args.order)
+    generator.load_training_data(synthetic_corpus(args.megabytes))
+    model = generator.compile()
+    synopsis_scoring.best_walks(model, 1, 1, args.max_length, args.min_length)
+    
+    print(f"{'candidates':>10} {'generate ms':>12} {'best-of ms':>12} {'overhead':>9}")
+    for candidates in args.candidates:
+        def generate():
+            model.generate_batch(candidates, args.max_length, args.min_length, batch_rng(1))
+        
+        def best_of():
+            synopsis_scoring.best_walks(model, 1, candidates, args.max_length, args.min_length,
+                                        batch_rng(1))
+        
+        number = max(1, 2000 // candidates)
+        plain = min(timeit.repeat(generate, number=number, repeat=args.repeat)) / number
+        best = min(timeit.repeat(best_of, number=number, repeat=args.repeat)) / number
+        print(f"{candidates:>10} {plain * 1e3:>12.2f} {best * 1e3:>12.2f} "
+              f"{best / plain - 1:>+9.1%}")
+
+
+if __name__ == "__main__":
+    main()
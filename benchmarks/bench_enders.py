@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Sentence-ender check benchmark
+
+Measures the per-token cost of deciding whether a word ends a sentence,
+before and after precomputing a flag per vocabulary entry:
+
+- generator-scan: the original per-step test,
+  any(word.endswith(end) for end in enders for word in [next_word])
+- endswith-tuple: a single str.endswith call with a tuple of enders
+- flag-table: one lookup in the per-word flag table built at training time
+
+Usage:
+    python benchmarks/bench_enders.py [--tokens 1000000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from book_synopsis_generator import BookSynopsisGenerator  # noqa: E402
+from synopsis_model import ENDS_SENTENCE  # noqa: E402
+
+
+def synthetic_text(tokens: int, seed: int = 0) -> str:
+    """
+    Build a corpus of short sentences over a small vocabulary.
+    
+    Args:
+        tokens: Number of words
+        seed: Seed for the corpus
+        
+    Returns:
+        Training text
+    """
+    rng = random.Random(seed)
+    vocab = [f"word{i}" for i in range(2000)]
+    words = []
+    for i in range(tokens):
+        word = rng.choice(vocab)
+        if rng.random() < 0.08:
+            word += rng.choice('.!?')
+        words.append(word.capitalize() if i == 0 or words[-1][-1] in '.!?' else word)
+    return ' '.join(words)
+
+
+def main():
+    """Run the ender-check benchmark and print per-token costs."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tokens', type=int, default=1000000)
+    args = parser.parse_args()
+    
+    text = synthetic_text(args.tokens)
+    generator = BookSynopsisGenerator()
+    generator.load_training_data(text)
+    model = generator.compile()
+    
+    words = text.split()
+    ids = [model.index[word] for word in words]
+    enders = generator.sentence_enders
+    enders_tuple = tuple(enders)
+    flags = model.flags
+    
+    def generator_scan():
+        for next_word in words:
+            any(word.endswith(end) for end in enders for word in [next_word])
+    
+    def endswith_tuple():
+        for word in words:
+            word.endswith(enders_tuple)
+    
+    def flag_table():
+        for word_id in ids:
+            flags[word_id] & ENDS_SENTENCE
+    
+    def baseline():
+        for _ in ids:
+            pass
+    
+    loop = min(timeit.repeat(baseline, number=1, repeat=3))
+    print(f"{'check':<16} {'ns/token':>10}   (loop overhead subtracted)")
+    for name, check in [('generator-scan', generator_scan), ('endswith-tuple', endswith_tuple),
+                        ('flag-table', flag_table)]:
+        seconds = min(timeit.repeat(check, number=1, repeat=3)) - loop
+        print(f"{name:<16} {seconds / len(words) * 1e9:>10.1f}")
+    
+    start = timeit.default_timer()
+    BookSynopsisGenerator().load_training_data(text)
+    seconds = timeit.default_timer() - start
+    print(f"\nTraining with flag-table starter checks: {seconds / len(words) * 1e9:.1f} ns/token")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Native kernel scaling benchmark
+
+Generates the same number of synopses with generate_multiple_synopses on
+the batch path (NumPy lockstep, or the pure-Python loop) and with the native
+kernel split across 1, 2, 4, ... threads, and prints synopses per second.
+Rendering to text is included, as it is for callers. The native kernel
+releases the GIL, so its rate should grow with the thread count up to the
+number of cores.
+
+Usage:
+    python benchmarks/bench_native.py [--megabytes 20] [--count 20000] [--threads 1 2 4 8]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synopsis_native  # noqa: E402
+from book_synopsis_generator import BookSynopsisGenerator  # noqa: E402
+from synthetic import synthetic_corpus  # noqa: E402
+
+
+def main():
+    """Run the scaling benchmark and print synopses per second."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--megabytes', type=float, default=20)
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    generator = BookSynopsisGenerator()
+    generator.load_training_data(synthetic_corpus(args.megabytes))
+    generator.generate_multiple_synopses(1)
+    if not synopsis_native.available():
+        print("native kernel unavailable (no C compiler?); only the batch path is measured")
+    
+    print(f"{'path':<14} {'synopses/s':>12}   ({os.cpu_count()} CPUs)")
+    runs = [('batch', 0)]
+    if synopsis_native.available():
+        runs += [(f"native x{threads}", threads) for threads in args.threads]
+    for name, threads in runs:
+        seconds = min(timeit.repeat(
+            lambda: generator.generate_multiple_synopses(args.count, rng=1, threads=threads),
+            number=1, repeat=args.repeat))
+        print(f"{name:<14} {args.count / seconds:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
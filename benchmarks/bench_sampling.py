@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Next-word sampling benchmark
+
+Compares the three ways of drawing a successor for a single state:
+list-choice over one list entry per occurrence (the original storage),
+cumulative-bisect over CSR counts, and O(1) alias tables. States with a
+high fan-out, such as "the", are where the difference shows.
+
+Usage:
+    python benchmarks/bench_sampling.py [--fanouts 10 100 1000 10000] [--draws 200000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from book_synopsis_generator import BookSynopsisGenerator  # noqa: E402
+
+
+def build_generator(fanout: int, occurrences: int, seed: int = 0) -> BookSynopsisGenerator:
+    """
+    Train a generator in which "the" is followed by `fanout` distinct words.
+    
+    Successor frequencies follow a Zipf-like distribution, as they do for
+    function words in real text.
+    
+    Args:
+        fanout: Number of distinct successors of "the"
+        occurrences: Number of times "the" occurs in the corpus
+        seed: Seed for the synthetic corpus
+    
+    Returns:
+        Trained generator
+    """
+    rng = random.Random(seed)
+    population = [f"word{i}" for i in range(fanout)]
+    weights = [1.0 / (i + 1) for i in range(fanout)]
+    # Make sure every successor occurs at least once
+    successors = population + rng.choices(population, weights, k=max(0, occurrences - fanout))
+    rng.shuffle(successors)
+    
+    words = []
+    for successor in successors:
+        words.append("the")
+        words.append(successor)
+    
+    generator = BookSynopsisGenerator()
+    generator.load_training_data(' '.join(words))
+    return generator
+
+
+def bench_state(generator: BookSynopsisGenerator, word: str, draws: int) -> dict:
+    """
+    Time each sampling strategy on one state.
+    
+    Args:
+        generator: Trained generator
+        word: State to sample successors of
+        draws: Number of draws per strategy
+    
+    Returns:
+        Nanoseconds per draw for each strategy
+    """
+    model = generator.compile()
+    state = model.index[word]
+    rng = random.Random(1)
+    
+    # The original storage: one list entry per successor occurrence
+    expanded = [successor for successor, count in generator.bigrams[word].items()
+                for _ in range(count)]
+    # Build the alias table up front so only steady-state draws are timed
+    model.alias_table(state)
+    
+    timings = {
+        'list-choice': timeit.timeit(lambda: rng.choice(expanded), number=draws),
+        'cumulative-bisect': timeit.timeit(lambda: model.next_id_bisect(state, rng), number=draws),
+        'alias': timeit.timeit(lambda: model.next_id(state, rng), number=draws),
+    }
+    return {name: seconds / draws * 1e9 for name, seconds in timings.items()}
+
+
+def main():
+    """Run the sampling benchmark and print a table."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--fanouts', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--draws', type=int, default=200000)
+    parser.add_argument('--occurrences-per-successor', type=int, default=20)
+    args = parser.parse_args()
+    
+    print(f"{'fanout':>8} {'list-choice':>14} {'cum-bisect':>14} {'alias':>14}   (ns/draw)")
+    for fanout in args.fanouts:
+        generator = build_generator(fanout, fanout * args.occurrences_per_successor)
+        result = bench_state(generator, "the", args.draws)
+        print(f"{fanout:>8} {result['list-choice']:>14.1f} "
+              f"{result['cumulative-bisect']:>14.1f} {result['alias']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
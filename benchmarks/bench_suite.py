@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite
+
+Trains on a synthetic Zipfian corpus (see synthetic.py) and measures:
+
+- train_tokens_per_s, train_mb_per_s: load_training_file throughput
+- compile_s: building the compiled model from the trained tables
+- peak_rss_mb: peak resident memory of training and compiling
+- load_mmap_s, load_read_s: BookSynopsisGenerator.load of the saved model,
+  memory-mapped and read into memory
+- latency_mean_us, latency_p50_us, latency_p90_us, latency_p99_us: the
+  distribution of single generate_synopsis calls
+- batch_synopses_per_s: generate_multiple_synopses throughput
+
+Every repeat runs in a fresh interpreter so peak RSS and load times are not
+flattered by an earlier repeat. Results, with every per-repeat sample and a
+description of the machine, are written as JSON for compare.py.
+
+Usage:
+    python benchmarks/bench_suite.py [--out results.json] [--megabytes 20] [--skew 1.1] [--repeat 5]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from book_synopsis_generator import BookSynopsisGenerator  # noqa: E402
+from synthetic import synthetic_corpus  # noqa: E402
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Unit and direction of every metric, in report order
+METRICS = {
+    'train_tokens_per_s': ('tokens/s', 'higher'),
+    'train_mb_per_s': ('MB/s', 'higher'),
+    'compile_s': ('s', 'lower'),
+    'peak_rss_mb': ('MB', 'lower'),
+    'load_mmap_s': ('s', 'lower'),
+    'load_read_s': ('s', 'lower'),
+    'latency_mean_us': ('us', 'lower'),
+    'latency_p50_us': ('us', 'lower'),
+    'latency_p90_us': ('us', 'lower'),
+    'latency_p99_us': ('us', 'lower'),
+    'batch_synopses_per_s': ('synopses/s', 'higher'),
+}
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a sorted sample."""
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def run_repeat(path: str, tokens: int, order: int, synopses: int, batch: int,
+               max_length: int, min_length: int, seed: int) -> Dict[str, float]:
+    """
+    Run every measurement once. Meant to run in a fresh process.
+    
+    Args:
+        path: Corpus file
+        tokens: Number of words in the corpus
+        order: Markov order to train
+        synopses: Number of single synopses to time
+        batch: Number of synopses per generate_multiple_synopses call
+        max_length: Maximum words per synopsis
+        min_length: Minimum words before a natural ending
+        seed: Seed for generation
+        
+    Returns:
+        One sample of each metric
+    """
+    random.seed(seed)
+    if np is not None:
+        np.random.seed(seed)
+    result = {}
+    
+    generator = BookSynopsisGenerator(order)
+    start = time.perf_counter()
+    generator.load_training_file(path)
+    seconds = time.perf_counter() - start
+    result['train_tokens_per_s'] = tokens / seconds
+    result['train_mb_per_s'] = os.path.getsize(path) / 1e6 / seconds
+    
+    start = time.perf_counter()
+    generator.compile()
+    result['compile_s'] = time.perf_counter() - start
+    result['peak_rss_mb'] = _peak_rss_mb()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'model.bsg')
+        generator.save(model_path)
+        del generator
+        for name, mmap in [('load_mmap_s', True), ('load_read_s', False)]:
+            start = time.perf_counter()
+            loaded = BookSynopsisGenerator.load(model_path, mmap=mmap)
+            result[name] = time.perf_counter() - start
+        
+        # Warm the start and batch tables, then time single calls
+        loaded.generate_multiple_synopses(1, max_length, min_length)
+        latencies = []
+        clock = time.perf_counter
+        for _ in range(synopses):
+            start = clock()
+            loaded.generate_synopsis(max_length, min_length)
+            latencies.append((clock() - start) * 1e6)
+        latencies.sort()
+        result['latency_mean_us'] = sum(latencies) / len(latencies)
+        result['latency_p50_us'] = _percentile(latencies, 0.50)
+        result['latency_p90_us'] = _percentile(latencies, 0.90)
+        result['latency_p99_us'] = _percentile(latencies, 0.99)
+        
+        rounds = max(1, synopses // batch)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            loaded.generate_multiple_synopses(batch, max_length, min_length)
+        result['batch_synopses_per_s'] = rounds * batch / (time.perf_counter() - start)
+        del loaded
+    return result
+
+
+def environment() -> Dict[str, object]:
+    """
+    Describe the machine and tree being measured.
+    
+    Returns:
+        Python, platform, CPU, NumPy and git details
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__ if np is not None else None,
+        'commit': commit,
+    }
+
+
+def main():
+    """Run the suite and write the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--out', help='JSON results file (default: print to stdout)')
+    parser.add_argument('--megabytes', type=float, default=20)
+    parser.add_argument('--vocab', type=int, default=20000)
+    parser.add_argument('--skew', type=float, default=1.1)
+    parser.add_argument('--order', type=int, default=1)
+    parser.add_argument('--synopses', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=256)
+    parser.add_argument('--max-length', type=int, default=100)
+    parser.add_argument('--min-length', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    config = {key: value for key, value in vars(args).items() if key != 'out'}
+    metrics = {name: {'unit': unit, 'better': better, 'samples': []}
+               for name, (unit, better) in METRICS.items()}
+    
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as f:
+        text = synthetic_corpus(args.megabytes, args.vocab, args.skew, args.seed)
+        f.write(text)
+        path = f.name
+    tokens = len(text.split())
+    del text
+    context = multiprocessing.get_context('spawn')
+    try:
+        for repeat in range(args.repeat):
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                sample = pool.submit(run_repeat, path, tokens, args.order, args.synopses, args.batch,
+                                     args.max_length, args.min_length,
+                                     args.seed + repeat).result()
+            for name, value in sample.items():
+                metrics[name]['samples'].append(value)
+            print(f"repeat {repeat + 1}/{args.repeat}: "
+                  f"{sample['train_mb_per_s']:.1f} MB/s train, "
+                  f"p50 {sample['latency_p50_us']:.0f} us, "
+                  f"p99 {sample['latency_p99_us']:.0f} us, "
+                  f"{sample['peak_rss_mb']:.0f} MB peak", file=sys.stderr)
+    finally:
+        os.unlink(path)
+    
+    results = {'environment': environment(), 'config': config, 'metrics': metrics}
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tokenizer throughput benchmark
+
+Measures how fast training text is turned into words, in MB of input per
+second:
+
+- regex-split: the original re.sub(r'\s+', ' ', text.strip()).split()
+- str-split: the default tokenizer, text.split()
+- text-stream: load_training_file's text-mode path, iter_word_runs over
+  chunks read from the file
+- mmap-buffer: load_training_file's path for UTF-8 files, iter_buffer_runs
+  over the memory-mapped file
+
+The last line shows the share of a full training run spent tokenizing.
+
+Usage:
+    python benchmarks/bench_tokenize.py [--megabytes 20]
+"""
+
+import argparse
+import mmap
+import os
+import random
+import re
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from book_synopsis_generator import (BookSynopsisGenerator, iter_buffer_runs,  # noqa: E402
+                                     iter_word_runs)
+
+
+def synthetic_corpus(megabytes: float, seed: int = 0) -> str:
+    """
+    Build a corpus of short sentences, wrapped into lines.
+    
+    Args:
+        megabytes: Approximate size of the corpus
+        seed: Seed for the corpus
+        
+    Returns:
+        Training text
+    """
+    rng = random.Random(seed)
+    vocab = [f"word{i}" for i in range(5000)]
+    lines = []
+    size = 0
+    while size < megabytes * 1e6:
+        words = [rng.choice(vocab) for _ in range(12)]
+        words[0] = words[0].capitalize()
+        words[-1] += rng.choice('.!?')
+        line = ' '.join(words)
+        lines.append(line)
+        size += len(line) + 1
+    return '\n'.join(lines)
+
+
+def main():
+    """Run the tokenizer benchmark and print MB/s for each path."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--megabytes', type=float, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    text = synthetic_corpus(args.megabytes)
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as f:
+        f.write(text)
+        path = f.name
+    size = os.path.getsize(path)
+    
+    def regex_split():
+        re.sub(r'\s+', ' ', text.strip()).split()
+    
+    def str_split():
+        text.split()
+    
+    def text_stream():
+        with open(path, encoding='utf-8') as f:
+            for _ in iter_word_runs(iter(lambda: f.read(1 << 20), '')):
+                pass
+    
+    def mmap_buffer():
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for _ in iter_buffer_runs(data):
+                pass
+    
+    try:
+        print(f"{'tokenizer':<14} {'MB/s':>10}   ({size / 1e6:.1f} MB)")
+        for name, tokenize in [('regex-split', regex_split), ('str-split', str_split),
+                               ('text-stream', text_stream), ('mmap-buffer', mmap_buffer)]:
+            seconds = min(timeit.repeat(tokenize, number=1, repeat=args.repeat))
+            print(f"{name:<14} {size / 1e6 / seconds:>10.1f}")
+        
+        tokenize_seconds = min(timeit.repeat(mmap_buffer, number=1, repeat=args.repeat))
+        start = timeit.default_timer()
+        BookSynopsisGenerator().load_training_file(path)
+        seconds = timeit.default_timer() - start
+        print(f"\nload_training_file: {size / 1e6 / seconds:.1f} MB/s, "
+              f"{tokenize_seconds / seconds:.0%} of it tokenizing")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Benchmark regression gate
+
+Compares two result files written by bench_suite.py. For every metric the
+relative change of the candidate's mean from the baseline's is estimated
+together with a bootstrap confidence interval over the per-repeat samples.
+A gated metric regresses when it got worse by more than the threshold and the
+whole interval lies on the worse side of zero, so run-to-run noise alone does
+not fail the gate. The command exits with status 1 if any gated metric
+regressed.
+
+By default the gate covers training throughput, single-synopsis latency
+percentiles and peak memory; other metrics are reported but never fail it.
+
+Usage:
+    python benchmarks/compare.py baseline.json candidate.json [--threshold 0.05]
+        [--metric-threshold latency_p99_us=0.10] [--confidence 0.95]
+"""
+
+import argparse
+import json
+import random
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+
+GATED_METRICS = ['train_tokens_per_s', 'latency_p50_us', 'latency_p90_us',
+                 'latency_p99_us', 'peak_rss_mb']
+
+# Environment fields that make runs incomparable when they differ
+_ENVIRONMENT_KEYS = ['python', 'implementation', 'machine', 'cpu_count', 'numpy']
+
+
+def _mean(samples: Sequence[float]) -> float:
+    """Arithmetic mean of a non-empty sample."""
+    return sum(samples) / len(samples)
+
+
+def bootstrap_change(baseline: Sequence[float], candidate: Sequence[float],
+                     confidence: float = 0.95, resamples: int = 10000,
+                     seed: int = 0) -> Tuple[float, Optional[Tuple[float, float]]]:
+    """
+    Estimate the relative change of the mean, with a percentile bootstrap interval.
+    
+    Args:
+        baseline: Per-repeat samples of the baseline run
+        candidate: Per-repeat samples of the candidate run
+        confidence: Coverage of the interval
+        resamples: Number of bootstrap resamples
+        seed: Seed for the resampling, so a comparison is repeatable
+        
+    Returns:
+        Relative change candidate / baseline - 1, and its confidence interval,
+        or None for the interval when either side has fewer than two samples
+    """
+    change = _mean(candidate) / _mean(baseline) - 1
+    if len(baseline) < 2 or len(candidate) < 2:
+        return change, None
+    rng = random.Random(seed)
+    changes = []
+    for _ in range(resamples):
+        base = _mean(rng.choices(baseline, k=len(baseline)))
+        cand = _mean(rng.choices(candidate, k=len(candidate)))
+        changes.append(cand / base - 1)
+    changes.sort()
+    tail = (1 - confidence) / 2
+    low = changes[int(tail * (resamples - 1))]
+    high = changes[int((1 - tail) * (resamples - 1))]
+    return change, (low, high)
+
+
+def compare(baseline: Dict, candidate: Dict, thresholds: Dict[str, float],
+            confidence: float = 0.95) -> List[Dict[str, object]]:
+    """
+    Compare every metric the two result files share.
+    
+    Args:
+        baseline: Parsed baseline results
+        candidate: Parsed candidate results
+        thresholds: Regression threshold of each gated metric, as a fraction
+        confidence: Coverage of the confidence intervals
+        
+    Returns:
+        One row per metric with its means, change, interval and status: one of
+        'regression', 'improved', 'ok' (within the threshold or the noise) or
+        'info' for metrics outside the gate
+    """
+    rows = []
+    for name, base in baseline['metrics'].items():
+        cand = candidate['metrics'].get(name)
+        if cand is None or not base['samples'] or not cand['samples']:
+            continue
+        change, interval = bootstrap_change(base['samples'], cand['samples'], confidence)
+        # Worse is positive: slower throughput, or more time or memory
+        sign = -1 if base['better'] == 'higher' else 1
+        worse = sign * change
+        if interval is None:
+            significant_worse = significant_better = True
+        else:
+            low, high = sorted((sign * interval[0], sign * interval[1]))
+            significant_worse = low > 0
+            significant_better = high < 0
+        if name not in thresholds:
+            status = 'info'
+        elif worse > thresholds[name] and significant_worse:
+            status = 'regression'
+        elif worse < -thresholds[name] and significant_better:
+            status = 'improved'
+        else:
+            status = 'ok'
+        rows.append({
+            'metric': name,
+            'unit': base['unit'],
+            'baseline': _mean(base['samples']),
+            'candidate': _mean(cand['samples']),
+            'change': change,
+            'interval': interval,
+            'threshold': thresholds.get(name),
+            'status': status,
+        })
+    return rows
+
+
+def _environment_differences(baseline: Dict, candidate: Dict) -> List[str]:
+    """Describe the environment and configuration fields that differ between runs."""
+    differences = []
+    for section, keys in [('environment', _ENVIRONMENT_KEYS), ('config', None)]:
+        base = baseline.get(section, {})
+        cand = candidate.get(section, {})
+        for key in keys if keys is not None else sorted(set(base) | set(cand)):
+            if key != 'repeat' and base.get(key) != cand.get(key):
+                differences.append(f"{section}.{key}: {base.get(key)} -> {cand.get(key)}")
+    return differences
+
+
+def main():
+    """Compare two benchmark runs and exit nonzero on a regression."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.05,
+                        help='relative worsening that counts as a regression (default 0.05)')
+    parser.add_argument('--metric-threshold', action='append', default=[],
+                        metavar='NAME=FRACTION',
+                        help='threshold for one metric; also adds it to the gate')
+    parser.add_argument('--confidence', type=float, default=0.95)
+    args = parser.parse_args()
+    
+    thresholds = {name: args.threshold for name in GATED_METRICS}
+    for item in args.metric_threshold:
+        name, sep, value = item.partition('=')
+        if not sep:
+            parser.error(f"--metric-threshold expects NAME=FRACTION, got {item!r}")
+        thresholds[name] = float(value)
+    
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    
+    for difference in _environment_differences(baseline, candidate):
+        print(f"warning: runs differ in {difference}", file=sys.stderr)
+    
+    rows = compare(baseline, candidate, thresholds, args.confidence)
+    interval_label = f"{args.confidence:.0%} CI"
+    print(f"{'metric':<22} {'baseline':>12} {'candidate':>12} {'change':>8} "
+          f"{interval_label:>18}  status")
+    for row in rows:
+        interval = row['interval']
+        interval_text = ('n < 2' if interval is None
+                         else f"[{interval[0]:+.1%}, {interval[1]:+.1%}]")
+        status = row['status']
+        if status == 'regression':
+            status = f"REGRESSION (> {row['threshold']:.0%})"
+        print(f"{row['metric']:<22} {row['baseline']:>12.4g} {row['candidate']:>12.4g} "
+              f"{row['change']:>+8.1%} {interval_text:>18}  {status}")
+    
+    regressions = [row['metric'] for row in rows if row['status'] == 'regression']
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
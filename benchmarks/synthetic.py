@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Synthetic corpus generator
+
+Writes book-summary-like text whose word frequencies follow a Zipf
+distribution: the word of rank r occurs with probability proportional to
+1 / r ** skew. Sentences are capitalized, end in '.', '!' or '?', and now and
+then contain a comma, so sentence starters and enders behave as they do in
+real text. The same arguments always give the same corpus.
+
+Usage:
+    python benchmarks/synthetic.py corpus.txt [--megabytes 50] [--vocab 20000] [--skew 1.1]
+"""
+
+import argparse
+import random
+from itertools import accumulate
+from typing import Iterator, List
+
+_SYLLABLES = ['an', 'ar', 'be', 'da', 'el', 'en', 'fa', 'gor', 'is', 'ka', 'lo', 'mir',
+              'na', 'or', 'pa', 'qu', 'ra', 'sel', 'th', 'ul', 'va', 'wyn', 'xe', 'zor']
+
+
+def make_vocab(size: int, seed: int = 0) -> List[str]:
+    """
+    Invent a vocabulary of distinct lowercase words.
+    
+    Args:
+        size: Number of words
+        seed: Seed for the word shapes
+        
+    Returns:
+        Words, most frequent rank first
+    """
+    rng = random.Random(seed)
+    words = []
+    seen = set()
+    while len(words) < size:
+        word = ''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def iter_sentences(vocab_size: int = 20000, skew: float = 1.1,
+                   seed: int = 0) -> Iterator[str]:
+    """
+    Generate an endless stream of sentences over a Zipf-distributed vocabulary.
+    
+    Args:
+        vocab_size: Number of distinct words
+        skew: Zipf exponent; larger values concentrate use on fewer words
+        seed: Seed for the corpus
+        
+    Yields:
+        Sentences
+    """
+    rng = random.Random(seed)
+    vocab = make_vocab(vocab_size, seed)
+    cum_weights = list(accumulate(1.0 / rank ** skew for rank in range(1, vocab_size + 1)))
+    while True:
+        length = rng.randint(6, 24)
+        words = rng.choices(vocab, cum_weights=cum_weights, k=length)
+        words[0] = words[0].capitalize()
+        if length > 10 and rng.random() < 0.3:
+            words[length // 2] += ','
+        words[-1] += rng.choice('..........!?')
+        yield ' '.join(words)
+
+
+def synthetic_corpus(megabytes: float, vocab_size: int = 20000, skew: float = 1.1,
+                     seed: int = 0) -> str:
+    """
+    Build a Zipfian corpus of about the given size.
+    
+    Args:
+        megabytes: Approximate size of the corpus in MB
+        vocab_size: Number of distinct words
+        skew: Zipf exponent
+        seed: Seed for the corpus
+        
+    Returns:
+        Training text, a few sentences per line
+    """
+    lines = []
+    size = 0
+    line = []
+    for sentence in iter_sentences(vocab_size, skew, seed):
+        line.append(sentence)
+        size += len(sentence) + 1
+        if len(line) == 4:
+            lines.append(' '.join(line))
+            line = []
+        if size >= megabytes * 1e6:
+            break
+    if line:
+        lines.append(' '.join(line))
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    """Write a synthetic corpus to a file."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('path')
+    parser.add_argument('--megabytes', type=float, default=50)
+    parser.add_argument('--vocab', type=int, default=20000)
+    parser.add_argument('--skew', type=float, default=1.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    text = synthetic_corpus(args.megabytes, args.vocab, args.skew, args.seed)
+    with open(args.path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    print(f"Wrote {len(text) / 1e6:.1f} MB to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
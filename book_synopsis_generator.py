@@ -2,25 +2,262 @@
 """
 Book Synopsis Generator using Markov Chains
 
-This program generates book summaries using a Markov chain model based on bigrams.
+This program generates book summaries using a Markov chain model based on bigrams
+or, optionally, higher-order n-grams.
 It analyzes training data to learn word transition probabilities and generates
 new text that resembles the training data.
 """
 
+import asyncio
+import codecs
+import mmap
+import os
 import random
 import re
-from collections import defaultdict
-from typing import Dict, List, Optional
+import time
+from collections import deque
+from typing import (AsyncIterator, Callable, Deque, Dict, Iterable, Iterator, List, Mapping,
+                    Optional, Set, Tuple, Union)
+
+import synopsis_native
+import synopsis_scoring
+from synopsis_metrics import MetricsSink, record_walk
+from synopsis_model import (CAPITALIZED, ENDS_SENTENCE, WORD_BITS, CompiledModel, pack_context,
+                            unpack_context, word_flags)
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; seeds then always make a random.Random
+    np = None
+
+# Turns text into words. A tokenizer must never join text across whitespace,
+# so that a corpus can be cut at any whitespace and tokenized piece by piece.
+# None stands for the default, str.split.
+Tokenizer = Callable[[str], List[str]]
+
+_WHITESPACE_BYTE = re.compile(rb'[ \t\n\r\x0b\x0c]')
+# Encodings in which an ASCII whitespace byte is always a whitespace character
+_ASCII_COMPATIBLE = {'ascii', 'utf-8', 'iso8859-1', 'cp1252'}
+
+# A source of randomness: an integer seed, a random.Random or a NumPy Generator.
+# None stands for the generator's own source, or failing that the random module.
+RandomSource = Union[int, random.Random, 'np.random.Generator']
+# Integer seeds are taken modulo 2**64, so any int seeds every path alike
+_SEED_MASK = (1 << 64) - 1
+
+
+def iter_word_runs(chunks: Iterable[str],
+                   tokenizer: Optional[Tokenizer] = None) -> Iterator[List[str]]:
+    """
+    Split a stream of text chunks into runs of whole words.
+    
+    A word touching the end of a chunk is held back until the next chunk
+    shows whether it continues, so words spanning chunk boundaries come out
+    whole. Concatenating the runs gives the same words as tokenizing the
+    joined chunks.
+    
+    Args:
+        chunks: Pieces of text, in order
+        tokenizer: Tokenizer to apply, or None to split on whitespace
+        
+    Yields:
+        Non-empty lists of words
+    """
+    partial = ''
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if tokenizer is None:
+            words = (partial + chunk).split()
+            partial = '' if chunk[-1].isspace() or not words else words.pop()
+        else:
+            # Hold back the raw text after the last whitespace
+            text = partial + chunk
+            cut = len(text)
+            while cut and not text[cut - 1].isspace():
+                cut -= 1
+            partial = text[cut:]
+            words = tokenizer(text[:cut]) if cut else []
+        if words:
+            yield words
+    if partial:
+        words = [partial] if tokenizer is None else tokenizer(partial)
+        if words:
+            yield words
+
+
+def iter_buffer_runs(buffer, encoding: str = 'utf-8', block_size: int = 1 << 20,
+                     tokenizer: Optional[Tokenizer] = None) -> Iterator[List[str]]:
+    """
+    Split encoded text held in a buffer into runs of whole words.
+    
+    The buffer (bytes, a memoryview or an mmap) is decoded one block at a
+    time, each block ending at an ASCII whitespace byte, so no word is cut
+    and the whole text is never decoded at once. The encoding must be one in
+    which ASCII whitespace bytes only ever stand for themselves, such as
+    UTF-8, ASCII or Latin-1.
+    
+    Args:
+        buffer: Encoded text
+        encoding: Text encoding of the buffer
+        block_size: Approximate number of bytes to decode at a time
+        tokenizer: Tokenizer to apply, or None to split on whitespace
+        
+    Yields:
+        Non-empty lists of words
+    """
+    size = len(buffer)
+    start = 0
+    while start < size:
+        end = start + block_size
+        if end < size:
+            match = _WHITESPACE_BYTE.search(buffer, end)
+            end = match.start() if match else size
+        else:
+            end = size
+        text = str(buffer[start:end], encoding)
+        words = text.split() if tokenizer is None else tokenizer(text)
+        if words:
+            yield words
+        start = end
+
+
+def spawn_rngs(seed: int, count: int) -> List[Union[random.Random, 'np.random.Generator']]:
+    """
+    Derive independent random streams for parallel workers from one seed.
+    
+    With NumPy the streams come from SeedSequence.spawn, which guarantees
+    they do not overlap; without it each is a random.Random seeded from the
+    seed and the stream's index.
+    
+    Args:
+        seed: Seed of the whole job
+        count: Number of streams
+        
+    Returns:
+        One random source per worker, usable as the rng of any generation call
+    """
+    if np is not None:
+        return [np.random.default_rng(child)
+                for child in np.random.SeedSequence(seed & _SEED_MASK).spawn(count)]
+    return [random.Random(f"{seed}/{i}") for i in range(count)]
+
+
+def scalar_rng(source: Optional[RandomSource]):
+    """
+    Get the random.Random-like object a single chain is walked with.
+    
+    Args:
+        source: Seed, random.Random or NumPy Generator; None for the random module
+        
+    Returns:
+        random.Random, or the random module itself; a NumPy Generator seeds a
+        new random.Random from its stream, since the walk draws one number at a time
+    """
+    if source is None:
+        return random
+    if isinstance(source, int):
+        return random.Random(source)
+    if np is not None and isinstance(source, np.random.Generator):
+        return random.Random(int(source.integers(1 << 63)))
+    return source
+
+
+def batch_rng(source: Optional[RandomSource]):
+    """
+    Get the random source that CompiledModel.generate_batch expects.
+    
+    Args:
+        source: Seed, random.Random or NumPy Generator; None for the random module.
+            Seeds may be any int, negative or wider than 64 bits
+        
+    Returns:
+        A NumPy Generator when NumPy is installed, otherwise a random.Random
+        or the random module
+    """
+    if np is None:
+        return scalar_rng(source)
+    if source is None:
+        return None  # generate_batch seeds one from the random module
+    if isinstance(source, int):
+        return np.random.default_rng(source & _SEED_MASK)
+    if isinstance(source, np.random.Generator):
+        return source
+    return np.random.default_rng(source.getrandbits(64))
+
+
+def seed_bits(source: Optional[RandomSource]) -> int:
+    """
+    Get a 64-bit seed for the native sampling kernel.
+    
+    Args:
+        source: Seed, random.Random or NumPy Generator; None for the random module
+        
+    Returns:
+        The seed itself, or 64 bits drawn from the source
+    """
+    if isinstance(source, int):
+        return source & _SEED_MASK
+    if np is not None and isinstance(source, np.random.Generator):
+        return int(source.integers(1 << 64, dtype=np.uint64))
+    return (source or random).getrandbits(64)
 
 
 class BookSynopsisGenerator:
     """A Markov chain-based text generator for book synopses."""
     
-    def __init__(self):
-        """Initialize the generator with empty bigram dictionary."""
-        self.bigrams: Dict[str, List[str]] = defaultdict(list)
-        self.sentence_starters: List[str] = []
+    def __init__(self, order: int = 1, tokenizer: Optional[Tokenizer] = None,
+                 metrics: Optional[MetricsSink] = None, rng: Optional[RandomSource] = None):
+        """
+        Initialize the generator with an empty transition table.
+        
+        Args:
+            order: Number of previous words the next word depends on
+                (1 for bigrams, 2 for trigrams, ...)
+            tokenizer: Function turning training text into words, or None to
+                split on whitespace; it must never join text across whitespace
+            metrics: Sink for training and generation metrics (see
+                synopsis_metrics), or None to leave instrumentation off
+            rng: Seed, random.Random or NumPy Generator this generator draws
+                from when a call is given none; None uses the random module
+        """
+        if order < 1:
+            raise ValueError(f"order must be at least 1, got {order}")
+        self.order = order
+        self.tokenizer = tokenizer
+        self.metrics = metrics
+        self.rng = random.Random(rng) if isinstance(rng, int) else rng
+        # Interned vocabulary: word -> id and id -> word
+        self.word_ids: Dict[str, int] = {}
+        self.words: List[str] = []
+        # ENDS_SENTENCE/CAPITALIZED bits of each word id
+        self.word_flags = bytearray()
+        self._flag_enders: Tuple[str, ...] = ()
+        # Maps each packed context of `order` word ids to a {next_word_id: count} table
+        self.transitions: Dict[int, Dict[int, int]] = {}
+        # Maps each packed context that opens a sentence to how often it did
+        self.sentence_starters: Dict[int, int] = {}
         self.sentence_enders: set = {'.', '!', '?'}
+        self._compiled: Optional[CompiledModel] = None
+        # Bumped by every change to the training data
+        self.generation = 0
+        # Packed context key -> state of the compiled model, kept for update()
+        self._states: Optional[Dict[int, int]] = None
+    
+    @property
+    def bigrams(self) -> Dict[object, Dict[str, int]]:
+        """
+        Decoded copy of the transition table, for inspection.
+        
+        Keys are words for order 1 and tuples of words for higher orders.
+        """
+        words = self.words
+        table = {}
+        for key, successors in self.transitions.items():
+            context = [words[i] for i in unpack_context(key, self.order)]
+            label = context[0] if self.order == 1 else tuple(context)
+            table[label] = {words[i]: count for i, count in successors.items()}
+        return table
         
     def load_training_data(self, text: str) -> None:
         """
@@ -31,21 +268,227 @@ class BookSynopsisGenerator:
         """
         # Clean and tokenize the text
         words = self._tokenize_text(text)
+        self._begin_update()
         
         # Build bigram dictionary
-        for i in range(len(words) - 1):
-            current_word = words[i]
-            next_word = words[i + 1]
-            self.bigrams[current_word].append(next_word)
+        self._add_words(words, deque(maxlen=self.order + 1))
+        
+        # Add the first context as a potential starter
+        self._add_first_starter(words)
+    
+    def load_training_stream(self, chunks: Iterable[str]) -> None:
+        """
+        Load training data incrementally from an iterable of text chunks.
+        
+        Chunks may be lines or arbitrary slices of the corpus; words that span
+        chunk boundaries are reassembled. The result is the same as passing
+        the concatenated chunks to load_training_data, without ever holding
+        the whole corpus in memory.
+        
+        Args:
+            chunks: Pieces of the training text, in order
+        """
+        self._load_runs(iter_word_runs(chunks, self.tokenizer))
+    
+    def load_training_buffer(self, buffer, encoding: str = 'utf-8',
+                             block_size: int = 1 << 20) -> None:
+        """
+        Load training data from encoded text in a buffer, such as an mmap.
+        
+        The buffer is decoded a block at a time, so the whole corpus is never
+        held as one string. The result is the same as decoding the buffer and
+        passing it to load_training_data.
+        
+        Args:
+            buffer: Encoded training text (bytes, memoryview or mmap)
+            encoding: Text encoding; ASCII whitespace bytes must only ever
+                stand for themselves, as in UTF-8, ASCII or Latin-1
+            block_size: Approximate number of bytes to decode at a time
+        """
+        self._load_runs(iter_buffer_runs(buffer, encoding, block_size, self.tokenizer))
+    
+    def load_training_file(self, path: str, encoding: str = 'utf-8',
+                           chunk_size: int = 1 << 20) -> None:
+        """
+        Load training data from a text file without reading it all at once.
+        
+        Files in UTF-8, ASCII or Latin-1 are memory-mapped and tokenized
+        straight from the mapping; other encodings are read as a text stream.
+        
+        Args:
+            path: Path of the training file
+            encoding: Text encoding of the file
+            chunk_size: Number of bytes (characters for a text stream) to
+                decode at a time
+        """
+        if codecs.lookup(encoding).name in _ASCII_COMPATIBLE and os.path.getsize(path):
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self.load_training_buffer(data, encoding, chunk_size)
+            return
+        with open(path, encoding=encoding) as f:
+            self.load_training_stream(iter(lambda: f.read(chunk_size), ''))
+    
+    def _load_runs(self, runs: Iterable[List[str]]) -> None:
+        """
+        Train on one corpus given as consecutive runs of words.
+        
+        Args:
+            runs: Lists of words, in corpus order
+        """
+        self._begin_update()
+        history: Deque[int] = deque(maxlen=self.order + 1)
+        head: List[str] = []
+        
+        for words in runs:
+            if len(head) < self.order:
+                head.extend(words[:self.order - len(head)])
+            self._add_words(words, history)
+        
+        # Add the first context as a potential starter
+        self._add_first_starter(head)
+    
+    def update(self, text: str) -> int:
+        """
+        Add one more document to a model that is already in use.
+        
+        The counts are added exactly as load_training_data would, but an
+        existing compiled model is patched instead of rebuilt: only the states
+        whose successor counts changed get new rows and lose their alias
+        tables, and the previous compiled model stays valid for anyone still
+        generating from it. Once the rows left behind by patching outnumber
+        the live ones, the model is compacted. The per-model tables of batch
+        and steered generation are rebuilt in full on first use after every
+        update (see CompiledModel.patched).
+        
+        Args:
+            text: Text of the new document
+            
+        Returns:
+            The generation number of the updated model
+        """
+        words = self._tokenize_text(text)
+        base = self._compiled
+        states = self._states
+        self._begin_update()
+        
+        changed: Set[int] = set()
+        starters_before = len(self.sentence_starters), sum(self.sentence_starters.values())
+        self._add_words(words, deque(maxlen=self.order + 1), changed)
+        self._add_first_starter(words)
+        
+        if base is not None and set(base.sentence_enders) == self.sentence_enders:
+            if states is None:
+                states = self._map_states(base)
+            starters_after = len(self.sentence_starters), sum(self.sentence_starters.values())
+            starters = self.sentence_starters if starters_after != starters_before else None
+            model = base.patched(self.words, self.transitions, changed, starters, states)
+            if model._superseded > model.num_transitions:
+                model = model.compacted()
+            self._compiled = model
+            self._states = states
+        return self.generation
+    
+    def _map_states(self, model: CompiledModel) -> Dict[int, int]:
+        """
+        Map the packed context keys of the training data to a model's states.
+        
+        Args:
+            model: Model compiled from this generator's current data
+            
+        Returns:
+            Mapping of packed context key to state
+        """
+        if self.order == 1:
+            # Compiling renumbers the words in state order
+            word_ids = self.word_ids
+            return {word_ids[word]: state for state, word in enumerate(model.vocab)}
+        return {pack_context(model.state_words(state)): state
+                for state in range(model.num_states)}
+    
+    def _add_words(self, words: List[str], history: Deque[int],
+                   changed: Optional[Set[int]] = None) -> None:
+        """
+        Add the transitions and sentence starters for a run of words.
+        
+        Args:
+            words: Words to add, in corpus order
+            history: Ids of the last `order + 1` words before `words`; updated
+                in place so the next run can continue from it
+            changed: If given, the packed context of every transition added
+                is collected here
+        """
+        self._refresh_word_flags()
+        word_ids = self.word_ids
+        vocab = self.words
+        flags = self.word_flags
+        transitions = self.transitions
+        sentence_starters = self.sentence_starters
+        enders = self._flag_enders
+        order = self.order
+        mask = (1 << (WORD_BITS * order)) - 1
+        context = pack_context(list(history)[-order:])
+        if self.metrics is not None:
+            self.metrics.count('tokens', len(words))
+            self.metrics.count('transitions', max(0, len(words) - max(0, order - len(history))))
+        
+        for word in words:
+            word_id = word_ids.get(word)
+            if word_id is None:
+                word_id = word_ids[word] = len(vocab)
+                vocab.append(word)
+                flags.append(word_flags(word, enders))
+                
+            seen = len(history)
+            if seen >= order:
+                successors = transitions.get(context)
+                if successors is None:
+                    successors = transitions[context] = {}
+                successors[word_id] = successors.get(word_id, 0) + 1
+                if changed is not None:
+                    changed.add(context)
+                
+                # Collect sentence starters (contexts that follow sentence endings)
+                if (seen > order and flags[history[0]] & ENDS_SENTENCE
+                        and flags[history[1]] & CAPITALIZED):
+                    sentence_starters[context] = sentence_starters.get(context, 0) + 1
+            history.append(word_id)
+            context = ((context << WORD_BITS) | word_id) & mask
+    
+    def _intern(self, word: str) -> int:
+        """
+        Get the id of a word, assigning the next free id to a new word.
+        
+        Args:
+            word: Word to look up
             
-            # Collect sentence starters (words that follow sentence endings)
-            if i > 0 and any(words[i-1].endswith(end) for end in self.sentence_enders):
-                if current_word[0].isupper():
-                    self.sentence_starters.append(current_word)
+        Returns:
+            Word id
+        """
+        word_id = self.word_ids.get(word)
+        if word_id is None:
+            self._refresh_word_flags()
+            word_id = self.word_ids[word] = len(self.words)
+            self.words.append(word)
+            self.word_flags.append(word_flags(word, self._flag_enders))
+        return word_id
+    
+    def _refresh_word_flags(self) -> None:
+        """Recompute the word flags if sentence_enders has changed."""
+        enders = tuple(self.sentence_enders)
+        if enders != self._flag_enders:
+            self._flag_enders = enders
+            self.word_flags = bytearray(word_flags(word, enders) for word in self.words)
+    
+    def _add_first_starter(self, head: List[str]) -> None:
+        """
+        Add the opening context of a corpus as a potential starter.
         
-        # Add the first word as a potential starter
-        if words and words[0][0].isupper():
-            self.sentence_starters.append(words[0])
+        Args:
+            head: The first words of the corpus; at least `order` are needed
+        """
+        if len(head) >= self.order and head[0][0].isupper():
+            context = pack_context(self.word_ids[word] for word in head[:self.order])
+            self.sentence_starters[context] = self.sentence_starters.get(context, 0) + 1
     
     def _tokenize_text(self, text: str) -> List[str]:
         """
@@ -57,72 +500,248 @@ class BookSynopsisGenerator:
         Returns:
             List of tokens
         """
-        # Replace multiple spaces with single space and split
-        text = re.sub(r'\s+', ' ', text.strip())
-        # Split on spaces but keep punctuation attached to words
-        words = text.split()
-        return words
+        if self.tokenizer is not None:
+            return self.tokenizer(text)
+        # Split on whitespace runs but keep punctuation attached to words
+        return text.split()
     
-    def generate_synopsis(self, max_length: int = 100, min_length: int = 20) -> str:
+    def generate_synopsis(self, max_length: int = 100, min_length: int = 20,
+                          rng: Optional[RandomSource] = None,
+                          avoid_dead_ends: bool = False, fit_length: bool = False) -> str:
         """
         Generate a book synopsis using the Markov chain.
         
         Args:
             max_length: Maximum number of words to generate
             min_length: Minimum number of words before allowing natural endings
+            rng: Seed, random.Random or NumPy Generator for this call; the
+                same seed always gives the same synopsis
+            avoid_dead_ends: Steer the walk away from states without
+                successors, and from states that cannot reach a sentence
+                ender, so it does not stop short of min_length
+            fit_length: Also steer the walk, as it nears max_length, toward
+                words from which it can still end a sentence in time, so the
+                synopsis ends naturally instead of being cut off; implies
+                avoid_dead_ends
             
         Returns:
             Generated synopsis text
         """
-        if not self.bigrams:
+        model = self.compile()
+        if not model.num_transitions:
             return "No training data available."
         
-        # Start with a good sentence starter
-        current_word = self._choose_starting_word()
-        synopsis = [current_word]
+        # Start with a good sentence starter and walk the chain on word ids
+        rng = scalar_rng(self.rng if rng is None else rng)
+        if avoid_dead_ends or fit_length:
+            start = model.choose_start_steered(rng, max_length, min_length, fit_length)
+            ids = model.generate_ids_steered(start, max_length, min_length, rng, fit_length)
+        else:
+            start = model.choose_start(rng)
+            ids = model.generate_ids(start, max_length, min_length, rng)
         
-        for i in range(max_length - 1):
-            # Get possible next words
-            next_words = self.bigrams.get(current_word, [])
-            
-            if not next_words:
-                # No more transitions possible
-                break
-            
-            # Choose next word based on probability (frequency)
-            next_word = random.choice(next_words)
-            synopsis.append(next_word)
+        # Post-process the text
+        return self._finish(model, ids, max_length, min_length)
+    
+    def iter_synopsis(self, max_length: int = 100, min_length: int = 20,
+                      rng: Optional[RandomSource] = None) -> Iterator[str]:
+        """
+        Generate a synopsis, yielding post-processed pieces as words are drawn.
+        
+        Each piece is a word with the space before it, so joining the pieces
+        gives exactly what generate_synopsis returns for the same rng. The
+        first piece is ready as soon as a starter has been chosen. If the
+        sentence enders have changed since the model was compiled, the text
+        can only be post-processed whole and comes as a single piece.
+        
+        Args:
+            max_length: Maximum number of words to generate
+            min_length: Minimum number of words before allowing natural endings
+            rng: Seed, random.Random or NumPy Generator for this call
             
-            # Check for natural ending after minimum length
-            if (i >= min_length - 1 and 
-                any(word.endswith(end) for end in self.sentence_enders for word in [next_word])):
-                break
+        Yields:
+            Pieces of the synopsis
+        """
+        model = self.compile()
+        if not model.num_transitions:
+            yield "No training data available."
+            return
+        
+        rng = scalar_rng(self.rng if rng is None else rng)
+        start = model.choose_start(rng)
+        walk = model.iter_ids(start, max_length, min_length, rng)
+        metrics = self.metrics
+        if not self._renders_flags(model):
+            yield self._finish(model, list(walk), max_length, min_length)
+            return
+        if metrics is None:
+            yield from model.iter_render(walk)
+            return
+        ids: List[int] = []
+        
+        def recorded() -> Iterator[int]:
+            for word in walk:
+                ids.append(word)
+                yield word
+        
+        yield from model.iter_render(recorded())
+        record_walk(metrics, model, ids, max_length, min_length)
+    
+    async def aiter_synopsis(self, max_length: int = 100, min_length: int = 20,
+                             rng: Optional[RandomSource] = None) -> AsyncIterator[str]:
+        """
+        Asynchronous iter_synopsis for use on an event loop.
+        
+        Control returns to the loop after every piece, so a long synopsis
+        never holds up other requests.
+        
+        Args:
+            max_length: Maximum number of words to generate
+            min_length: Minimum number of words before allowing natural endings
+            rng: Seed, random.Random or NumPy Generator for this call
             
-            current_word = next_word
+        Yields:
+            Pieces of the synopsis
+        """
+        for piece in self.iter_synopsis(max_length, min_length, rng):
+            yield piece
+            await asyncio.sleep(0)
+    
+    def compile(self) -> CompiledModel:
+        """
+        Get the frozen, integer-interned form of the trained model.
         
-        # Post-process the text
-        result = ' '.join(synopsis)
-        return self._post_process_text(result)
+        The compiled model is cached and rebuilt only after more training data
+        has been loaded or sentence_enders has changed.
+        
+        Returns:
+            Compiled model
+        """
+        model = self._compiled
+        if model is not None and set(model.sentence_enders) != self.sentence_enders:
+            # Word flags and starting states depend on the enders
+            self._begin_update()
+        if self._compiled is None:
+            self._compiled = CompiledModel.build(self.words, self.transitions,
+                                                 self.sentence_starters, self.sentence_enders,
+                                                 self.order)
+        return self._compiled
+    
+    def save(self, path: str) -> None:
+        """
+        Save the trained model to a binary file.
+        
+        Args:
+            path: Destination path
+        """
+        self.compile().save(path)
     
-    def _choose_starting_word(self) -> str:
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'BookSynopsisGenerator':
+        """
+        Load a model written by save().
+        
+        The returned generator can generate straight away. Its transition table is
+        only rebuilt from the file if more training data is loaded into it.
+        
+        Args:
+            path: Path of the model file
+            mmap: Memory-map the file instead of reading it into memory
+            
+        Returns:
+            Generator backed by the saved model
+        """
+        model = CompiledModel.load(path, mmap=mmap)
+        generator = cls(model.order)
+        generator.sentence_enders = set(model.sentence_enders)
+        generator._compiled = model
+        return generator
+    
+    def _begin_update(self) -> None:
+        """Prepare the transition table for more training data."""
+        self.generation += 1
+        self._states = None
+        model = self._compiled
+        if model is not None and not self.transitions and not self.sentence_starters:
+            # Loaded from a file: rebuild the table from the compiled model
+            self.words = list(model.vocab)
+            self.word_ids = {word: i for i, word in enumerate(self.words)}
+            self.word_flags = bytearray(model.flags)
+            self._flag_enders = model.sentence_enders
+            for state in range(model.num_states):
+                counts = model.successor_counts(state)
+                if counts:
+                    self.transitions[pack_context(model.state_words(state))] = counts
+            previous = 0
+            for state, total in zip(model.starters, model.starter_cumulative):
+                self.sentence_starters[pack_context(model.state_words(state))] = total - previous
+                previous = total
+        self._compiled = None
+    
+    def _choose_starting_word(self, rng: Optional[RandomSource] = None) -> str:
         """
         Choose a good starting word for the synopsis.
         
+        Args:
+            rng: Seed, random.Random or NumPy Generator for this call
+        
         Returns:
             Starting word
         """
-        if self.sentence_starters:
-            return random.choice(self.sentence_starters)
-        elif self.bigrams:
-            # Fallback to any word that starts with capital letter
-            capitalized_words = [word for word in self.bigrams.keys() 
-                               if word and word[0].isupper()]
-            if capitalized_words:
-                return random.choice(capitalized_words)
-            else:
-                return random.choice(list(self.bigrams.keys()))
-        else:
+        model = self.compile()
+        if not model.num_transitions:
             return "The"
+        start = model.choose_start(scalar_rng(self.rng if rng is None else rng))
+        return ' '.join(model.decode(model.state_words(start)))
+    
+    def _finish(self, model: CompiledModel, ids: List[int], max_length: int,
+                min_length: int) -> str:
+        """
+        Render a generated walk, recording it when instrumentation is on.
+        
+        Args:
+            model: Model the ids were generated from
+            ids: Generated word ids
+            max_length: Maximum number of words the walk was allowed
+            min_length: Minimum number of words before natural endings
+            
+        Returns:
+            Improved text
+        """
+        metrics = self.metrics
+        if metrics is None:
+            return self._render(model, ids)
+        record_walk(metrics, model, ids, max_length, min_length)
+        start = time.perf_counter()
+        text = self._render(model, ids)
+        metrics.observe('post_process_seconds', time.perf_counter() - start)
+        return text
+    
+    def _render(self, model: CompiledModel, ids: List[int]) -> str:
+        """
+        Turn generated word ids into post-processed text.
+        
+        The model renders the words straight from its precomputed flags. That
+        matches _post_process_text exactly unless the sentence enders have
+        changed since the model was compiled or one of them contains
+        whitespace, in which case the text is post-processed as a string.
+        
+        Args:
+            model: Model the ids were generated from
+            ids: Generated word ids
+            
+        Returns:
+            Improved text
+        """
+        if self._renders_flags(model):
+            return model.render(ids)
+        return self._post_process_text(' '.join(model.decode(ids)))
+    
+    def _renders_flags(self, model: CompiledModel) -> bool:
+        """Whether rendering from the model's word flags matches _post_process_text."""
+        enders = model.sentence_enders
+        return set(enders) == self.sentence_enders and not any(
+            char.isspace() for end in enders for char in end)
     
     def _post_process_text(self, text: str) -> str:
         """
@@ -155,28 +774,123 @@ class BookSynopsisGenerator:
         Args:
             sample_size: Number of bigrams to display
         """
+        model = self.compile()
+        vocab = model.vocab
         print("Sample of bigrams dictionary:")
-        items = list(self.bigrams.items())[:sample_size]
-        for word, next_words in items:
-            print(f'"{word}": {next_words[:10]}{"..." if len(next_words) > 10 else ""}')
+        shown = 0
+        for state in range(model.num_states):
+            if shown >= sample_size:
+                break
+            next_words = model.successor_counts(state)
+            if not next_words:
+                continue
+            context = ' '.join(model.decode(model.state_words(state)))
+            sample = {vocab[i]: n for i, n in list(next_words.items())[:10]}
+            print(f'"{context}": {sample}{"..." if len(next_words) > 10 else ""}')
+            shown += 1
         print()
     
-    def generate_multiple_synopses(self, count: int = 5, max_length: int = 100) -> List[str]:
+    def generate_multiple_synopses(self, count: int = 5, max_length: int = 100,
+                                   min_length: int = 20, rng: Optional[RandomSource] = None,
+                                   threads: int = 0, avoid_dead_ends: bool = False,
+                                   fit_length: bool = False) -> List[str]:
         """
-        Generate multiple synopses and return the best one based on simple heuristics.
+        Generate multiple synopses.
+        
+        The chains are generated as one batch, advanced in lockstep with NumPy
+        when it is installed. With `threads`, they are instead walked by the
+        native kernel (see synopsis_native), which releases the GIL, split
+        across that many threads; without a C compiler the batch path is used.
+        To keep only the best of them, use generate_best_synopses.
         
         Args:
             count: Number of synopses to generate
             max_length: Maximum length for each synopsis
+            min_length: Minimum number of words before allowing natural endings
+            rng: Seed, random.Random or NumPy Generator for this call; a seed
+                gives the same synopses as a /generate request with that seed
+            threads: Number of threads for the native kernel, or 0 not to use it;
+                the native kernel gives other synopses for the same seed
+            avoid_dead_ends: Steer every walk as generate_synopsis does; the
+                chains are then walked one at a time
+            fit_length: Steer every walk toward a natural ending by max_length,
+                as generate_synopsis does; the chains are then walked one at a time
             
         Returns:
             List of generated synopses
         """
-        synopses = []
-        for _ in range(count):
-            synopsis = self.generate_synopsis(max_length)
-            synopses.append(synopsis)
-        return synopses
+        model = self.compile()
+        if not model.num_transitions:
+            return ["No training data available."] * count
+        
+        chains = self._generate_chains(model, count, max_length, min_length,
+                                       self.rng if rng is None else rng, threads,
+                                       avoid_dead_ends, fit_length)
+        return [self._finish(model, ids, max_length, min_length) for ids in chains]
+    
+    def generate_best_synopses(self, k: int = 1, candidates: int = 64, max_length: int = 100,
+                               min_length: int = 20, rng: Optional[RandomSource] = None,
+                               threads: int = 0, avoid_dead_ends: bool = False,
+                               fit_length: bool = False, target_length: Optional[int] = None,
+                               weights: Optional[Mapping[str, float]] = None) -> List[str]:
+        """
+        Generate a batch of candidate synopses and return the best k.
+        
+        Candidates are scored on their mean log-likelihood under the model,
+        repeated transitions, how well their length fits and whether they end
+        a sentence (see synopsis_scoring). Only the chosen ones are rendered.
+        On the plain batch path the walks are scored straight from the
+        transitions they drew, which adds only a few percent to generating them.
+        
+        Args:
+            k: Number of synopses to return
+            candidates: Number of synopses to choose from
+            max_length: Maximum length for each synopsis
+            min_length: Minimum number of words before allowing natural endings
+            rng: Seed, random.Random or NumPy Generator for this call; a seed
+                gives the same synopses as a /generate request with that seed
+                and best_of = candidates / k
+            threads: Number of threads for the native kernel, or 0 not to use it
+            avoid_dead_ends: Steer every walk as generate_synopsis does
+            fit_length: Steer every walk toward a natural ending by max_length
+            target_length: Number of words to prefer; by default only synopses
+                that stop short of min_length are penalized for their length
+            weights: Weight of each score component, overriding
+                synopsis_scoring.DEFAULT_WEIGHTS
+                
+        Returns:
+            Best synopses, best first
+        """
+        model = self.compile()
+        if not model.num_transitions:
+            return ["No training data available."] * min(k, candidates)
+        
+        rng = self.rng if rng is None else rng
+        if avoid_dead_ends or fit_length or threads and synopsis_native.available():
+            chains = self._generate_chains(model, candidates, max_length, min_length, rng,
+                                           threads, avoid_dead_ends, fit_length)
+            scores = synopsis_scoring.score_chains(model, chains, min_length, target_length,
+                                                   weights)
+            chains = [chains[i] for i in synopsis_scoring.top_k(scores, k)]
+        else:
+            chains = synopsis_scoring.best_walks(model, k, candidates, max_length, min_length,
+                                                 batch_rng(rng), target_length, weights)
+        return [self._finish(model, ids, max_length, min_length) for ids in chains]
+    
+    def _generate_chains(self, model: CompiledModel, count: int, max_length: int,
+                         min_length: int, rng: Optional[RandomSource], threads: int,
+                         avoid_dead_ends: bool, fit_length: bool) -> List[List[int]]:
+        """Walk `count` chains on the path generate_multiple_synopses describes."""
+        if avoid_dead_ends or fit_length:
+            rng = scalar_rng(rng)
+            return [model.generate_ids_steered(
+                        model.choose_start_steered(rng, max_length, min_length, fit_length),
+                        max_length, min_length, rng, fit_length)
+                    for _ in range(count)]
+        if threads and synopsis_native.available():
+            return synopsis_native.generate_batch(model, count, max_length, min_length,
+                                                  seed_bits(rng), threads)
+        return model.generate_batch(count, max_length, min_length, batch_rng(rng))
     
     def get_stats(self) -> Dict[str, int]:
         """
@@ -185,13 +899,19 @@ class BookSynopsisGenerator:
         Returns:
             Dictionary with statistics
         """
-        total_words = len(self.bigrams)
-        total_transitions = sum(len(transitions) for transitions in self.bigrams.values())
+        model = self.compile()
+        total_words = 0
+        total_transitions = 0
+        for state in range(model.num_states):
+            lo, hi = model.row(state)
+            if hi > lo:
+                total_words += 1
+                total_transitions += model.cumulative[hi - 1]
         
         return {
             'unique_words': total_words,
             'total_transitions': total_transitions,
-            'sentence_starters': len(set(self.sentence_starters))
+            'sentence_starters': len(model.starters)
         }
 
 
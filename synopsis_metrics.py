@@ -0,0 +1,238 @@
+"""
+Instrumentation
+
+A BookSynopsisGenerator given a metrics sink reports what training and
+generation do:
+
+Counters
+    tokens: words tokenized and added to the model
+    transitions: transitions counted
+    synopses: synopses generated
+    dead_ends: walks that stopped at a state without successors
+    ender_stops: walks that stopped at a sentence ender after min_length
+    max_length_stops: walks that ran to max_length
+
+Histograms
+    steps: words generated by one walk, after its starting context
+    post_process_seconds: time spent turning one walk into text
+
+Instrumentation is off by default. The hooks then cost one `is None` check per
+run of training words and per synopsis; nothing is added to the inner loops,
+since the way a walk ended can be read off its output afterwards.
+
+A sink is any object with `count(name, value)` and `observe(name, value)`.
+HistogramSink aggregates in process, PrometheusSink also renders the text
+exposition format, and CallbackSink hands every event to a function.
+"""
+
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence
+
+from synopsis_model import ENDS_SENTENCE, CompiledModel
+
+# Default histogram bucket upper bounds
+STEP_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SECONDS_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3,
+                   2.5e-3, 5e-3, 1e-2, 0.1, 1.0)
+
+
+class MetricsSink:
+    """Receives counter increments and histogram observations; ignores them by default."""
+    
+    def count(self, name: str, value: float = 1) -> None:
+        """
+        Increment a counter.
+        
+        Args:
+            name: Counter name
+            value: Amount to add
+        """
+    
+    def observe(self, name: str, value: float) -> None:
+        """
+        Record one observation of a histogram.
+        
+        Args:
+            name: Histogram name
+            value: Observed value
+        """
+
+
+class HistogramSink(MetricsSink):
+    """In-process counters and fixed-bucket histograms."""
+    
+    def __init__(self, buckets: Optional[Dict[str, Sequence[float]]] = None):
+        """
+        Initialize an empty sink.
+        
+        Args:
+            buckets: Bucket upper bounds per histogram name; names ending in
+                '_seconds' default to SECONDS_BUCKETS, others to STEP_BUCKETS
+        """
+        self.buckets = dict(buckets or {})
+        self.counters: Dict[str, float] = {}
+        # name -> [per-bucket counts (last one is +Inf), sum, count]
+        self.histograms: Dict[str, List] = {}
+        self._lock = threading.Lock()
+    
+    def count(self, name: str, value: float = 1) -> None:
+        """Increment a counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+    
+    def observe(self, name: str, value: float) -> None:
+        """Record one observation of a histogram."""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                bounds = self.buckets.get(name)
+                if bounds is None:
+                    bounds = self.buckets[name] = (
+                        SECONDS_BUCKETS if name.endswith('_seconds') else STEP_BUCKETS)
+                histogram = self.histograms[name] = [[0] * (len(bounds) + 1), 0.0, 0]
+            histogram[0][bisect_left(self.buckets[name], value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+    
+    def quantile(self, name: str, fraction: float) -> Optional[float]:
+        """
+        Estimate a quantile of a histogram.
+        
+        Args:
+            name: Histogram name
+            fraction: Quantile to estimate, between 0 and 1
+            
+        Returns:
+            Upper bound of the bucket holding the quantile (infinity for the
+            overflow bucket), or None if nothing was observed
+        """
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None or not histogram[2]:
+                return None
+            counts, _, total = histogram
+            bounds = self.buckets[name]
+        rank = fraction * total
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= rank and n:
+                return bounds[i] if i < len(bounds) else float('inf')
+        return float('inf')
+    
+    def snapshot(self) -> Dict[str, object]:
+        """
+        Get a copy of everything recorded.
+        
+        Returns:
+            'counters' mapping names to totals, and 'histograms' mapping names
+            to their count, sum, mean and cumulative (upper bound, count) buckets
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {name: (list(counts), total, n)
+                          for name, (counts, total, n) in self.histograms.items()}
+        summary = {}
+        for name, (counts, total, n) in histograms.items():
+            bounds = list(self.buckets[name]) + [float('inf')]
+            cumulative = []
+            seen = 0
+            for bound, count in zip(bounds, counts):
+                seen += count
+                cumulative.append((bound, seen))
+            summary[name] = {'count': n, 'sum': total, 'mean': total / n if n else None,
+                             'buckets': cumulative}
+        return {'counters': counters, 'histograms': summary}
+    
+    def reset(self) -> None:
+        """Forget everything recorded."""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+class PrometheusSink(HistogramSink):
+    """HistogramSink that renders its metrics in the Prometheus text format."""
+    
+    def __init__(self, namespace: str = 'bsg',
+                 buckets: Optional[Dict[str, Sequence[float]]] = None):
+        """
+        Initialize an empty sink.
+        
+        Args:
+            namespace: Prefix of every metric name
+            buckets: Bucket upper bounds per histogram name
+        """
+        super().__init__(buckets)
+        self.namespace = namespace
+    
+    def exposition(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+        
+        Returns:
+            Counters as `<namespace>_<name>_total` and histograms as
+            `_bucket`, `_sum` and `_count` series
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = f"{self.namespace}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, histogram in sorted(snapshot['histograms'].items()):
+            metric = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for bound, count in histogram['buckets']:
+                label = '+Inf' if bound == float('inf') else f"{bound:g}"
+                lines.append(f'{metric}_bucket{{le="{label}"}} {count}')
+            lines.append(f"{metric}_sum {histogram['sum']}")
+            lines.append(f"{metric}_count {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+class CallbackSink(MetricsSink):
+    """Forwards every event to a function."""
+    
+    def __init__(self, callback: Callable[[str, str, float], None]):
+        """
+        Initialize the sink.
+        
+        Args:
+            callback: Called as callback(kind, name, value), where kind is
+                'count' or 'observe'
+        """
+        self.callback = callback
+    
+    def count(self, name: str, value: float = 1) -> None:
+        """Forward a counter increment."""
+        self.callback('count', name, value)
+    
+    def observe(self, name: str, value: float) -> None:
+        """Forward a histogram observation."""
+        self.callback('observe', name, value)
+
+
+def record_walk(sink: MetricsSink, model: CompiledModel, ids: Sequence[int],
+                max_length: int, min_length: int) -> None:
+    """
+    Record how one walk of generate_ids or generate_batch went.
+    
+    Args:
+        sink: Sink to report to
+        model: Model the walk ran on
+        ids: Generated word ids, starting with the starting context
+        max_length: Maximum number of words the walk was allowed
+        min_length: Minimum number of words before natural endings
+    """
+    length = len(ids)
+    steps = length - model.order
+    sink.count('synopses')
+    sink.observe('steps', steps)
+    if steps > 0 and length > min_length and model.flags[ids[-1]] & ENDS_SENTENCE:
+        sink.count('ender_stops')
+    elif length < max_length:
+        sink.count('dead_ends')
+    else:
+        sink.count('max_length_stops')
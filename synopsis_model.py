@@ -0,0 +1,1459 @@
+"""
+Compiled Markov Chain Model
+
+This module holds the frozen, integer-interned form of a trained
+BookSynopsisGenerator. Tokens are mapped to integer ids and the transition
+table is laid out CSR-style in flat typed arrays, so generation runs on ids
+and only turns them back into strings at the very end.
+
+Each row of the table is a state: the context of the last `order` words.
+Alongside every successor word the table stores the state that emitting it
+leads to, so generation never has to look contexts up. For order 1 the
+states are the words themselves and both arrays are the same.
+"""
+
+import mmap
+import os
+import random
+import struct
+from array import array
+from bisect import bisect_right
+from collections import deque
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; batch generation falls back to a loop
+    np = None
+
+# Per-state alias table: (columns, keep-primary thresholds, row start, alias
+# positions in the successor arrays); column i's primary position is row start + i
+AliasTable = Tuple[int, List[float], int, List[int]]
+# Alias table over arbitrary items: (columns, keep-primary thresholds, primary
+# and alias items)
+ItemAliasTable = Tuple[int, List[float], List[int], List[int]]
+
+# Per-word flag bits, computed once when a word is first seen
+ENDS_SENTENCE = 0x01
+CAPITALIZED = 0x02
+JOINS_PREVIOUS = 0x04  # Starts with punctuation that attaches to the previous word
+INNER_BREAK = 0x08  # Has a '.', '!' or '?' directly followed by a capital letter
+
+_ATTACHING = '.!?,:;'
+_BREAKS = '.!?'
+
+# Training contexts are packed into one integer, WORD_BITS per word id
+WORD_BITS = 32
+_WORD_MASK = (1 << WORD_BITS) - 1
+
+# On-disk layout: a fixed header, a section table, then 8-byte aligned sections
+# holding raw native-endian arrays that can be used in place from a mapping.
+MAGIC = b'BSGMODEL'
+FORMAT_VERSION = 5
+_BYTE_ORDER_MARK = 0x01020304
+_HEADER = struct.Struct('=8sIII4x')  # magic, byte order mark, version, section count
+_SECTION = struct.Struct('=8sc7xQQ')  # name, array typecode, offset, item count
+
+# Distance of a state from which no sentence ender or dead end can be reached
+UNREACHABLE = 0x7fffffff
+
+
+def word_flags(word: str, sentence_enders: Tuple[str, ...]) -> int:
+    """
+    Compute the flag bits of a word.
+    
+    Args:
+        word: Word to classify
+        sentence_enders: Suffixes that mark the end of a sentence
+        
+    Returns:
+        ENDS_SENTENCE, CAPITALIZED, JOINS_PREVIOUS and INNER_BREAK bits for the word
+    """
+    flags = 0
+    if word.endswith(sentence_enders):
+        flags |= ENDS_SENTENCE
+    if word[:1].isupper():
+        flags |= CAPITALIZED
+    if word[:1] and word[0] in _ATTACHING:
+        flags |= JOINS_PREVIOUS
+    for i in range(len(word) - 1):
+        if word[i] in _BREAKS and 'A' <= word[i + 1] <= 'Z':
+            flags |= INNER_BREAK
+            break
+    return flags
+
+
+def break_sentences(word: str) -> str:
+    """
+    Put a space between each '.', '!' or '?' and a capital letter right after it.
+    
+    Args:
+        word: Word with the INNER_BREAK flag
+        
+    Returns:
+        The word with the spaces inserted
+    """
+    parts = []
+    start = 0
+    for i in range(len(word) - 1):
+        if word[i] in _BREAKS and 'A' <= word[i + 1] <= 'Z':
+            parts.append(word[start:i + 1])
+            start = i + 1
+    parts.append(word[start:])
+    return ' '.join(parts)
+
+
+def pack_context(ids: Iterable[int]) -> int:
+    """
+    Pack a context of word ids into a single integer key.
+    
+    Args:
+        ids: Word ids, oldest first
+        
+    Returns:
+        Packed context key
+    """
+    key = 0
+    for word_id in ids:
+        key = (key << WORD_BITS) | word_id
+    return key
+
+
+def unpack_context(key: int, order: int) -> List[int]:
+    """
+    Unpack a context key made by pack_context.
+    
+    Args:
+        key: Packed context key
+        order: Number of words in the context
+        
+    Returns:
+        Word ids, oldest first
+    """
+    return [(key >> (WORD_BITS * shift)) & _WORD_MASK for shift in range(order - 1, -1, -1)]
+
+
+def build_alias(cumulative: Sequence[int], lo: int, hi: int) -> Tuple[List[float], List[int]]:
+    """
+    Build a Walker/Vose alias table over a run of cumulative weights.
+    
+    Column i keeps index lo + i with probability thresholds[i] and otherwise
+    takes aliases[i]. The table is built with integer arithmetic and only
+    the final thresholds are rounded to floats, so sampling from it matches
+    the weights to within double precision.
+    
+    Args:
+        cumulative: Running totals of integer weights
+        lo: First index of the run
+        hi: End of the run
+        
+    Returns:
+        Thresholds and alias indices, one per column
+    """
+    n = hi - lo
+    total = cumulative[hi - 1] if n else 0
+    
+    # Scale every weight by n so that an even column holds exactly `total`
+    scaled = [0] * n
+    previous = 0
+    for i in range(n):
+        weight = cumulative[lo + i]
+        scaled[i] = (weight - previous) * n
+        previous = weight
+    
+    thresholds = [1.0] * n
+    aliases = list(range(lo, hi))
+    small = [i for i in range(n) if scaled[i] < total]
+    large = [i for i in range(n) if scaled[i] >= total]
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+        thresholds[less] = scaled[less] / total
+        aliases[less] = lo + more
+        scaled[more] -= total - scaled[less]
+        if scaled[more] < total:
+            small.append(more)
+        else:
+            large.append(more)
+    return thresholds, aliases
+
+
+def reverse_distances(offsets: Sequence[int], targets: Sequence[int], seeds: Iterable[int],
+                      seed_distance: int) -> array:
+    """
+    Breadth-first search backwards along the transitions of a CSR state graph.
+    
+    Args:
+        offsets: Row start of each state; has one extra end entry
+        targets: State each transition leads to
+        seeds: States at distance `seed_distance`
+        seed_distance: Distance of the seeds
+        
+    Returns:
+        Fewest transitions from each state to a seed plus `seed_distance`,
+        or UNREACHABLE
+    """
+    num_states = len(offsets) - 1
+    if np is not None:
+        offsets = np.asarray(offsets, dtype=np.int64)
+        sources = np.repeat(np.arange(num_states, dtype=np.int64), np.diff(offsets))
+        targets = np.asarray(targets, dtype=np.int64)
+        distance = np.full(num_states, UNREACHABLE, dtype=np.int32)
+        frontier = np.zeros(num_states, dtype=bool)
+        frontier[np.fromiter(seeds, dtype=np.int64)] = True
+        distance[frontier] = level = seed_distance
+        # One level at a time: the unvisited sources of edges into the frontier
+        while frontier.any():
+            level += 1
+            reached = sources[frontier[targets]]
+            reached = reached[distance[reached] == UNREACHABLE]
+            frontier[:] = False
+            frontier[reached] = True
+            distance[reached] = level
+        return array('i', distance.tobytes())
+    
+    predecessors: List[List[int]] = [[] for _ in range(num_states)]
+    for state in range(num_states):
+        for position in range(offsets[state], offsets[state + 1]):
+            predecessors[targets[position]].append(state)
+    distance = array('i', [UNREACHABLE]) * num_states
+    queue = deque()
+    for state in seeds:
+        if distance[state] == UNREACHABLE:
+            distance[state] = seed_distance
+            queue.append(state)
+    while queue:
+        state = queue.popleft()
+        level = distance[state] + 1
+        for source in predecessors[state]:
+            if distance[source] == UNREACHABLE:
+                distance[source] = level
+                queue.append(source)
+    return distance
+
+
+def walk_limits(offsets: Sequence[int], targets: Sequence[int]) -> array:
+    """
+    Find how far a walk can get from each state of a CSR state graph.
+    
+    States are settled backwards from the dead ends: a state is settled once
+    all of its successors are, one more step than the last of them.
+    
+    Args:
+        offsets: Row start of each state; has one extra end entry
+        targets: State each transition leads to
+        
+    Returns:
+        Most transitions a walk can take from each state before it reaches a
+        dead end (0 for dead ends), or UNREACHABLE if it can go on forever
+    """
+    num_states = len(offsets) - 1
+    if np is not None:
+        offsets = np.asarray(offsets, dtype=np.int64)
+        sizes = np.diff(offsets)
+        sources = np.repeat(np.arange(num_states, dtype=np.int64), sizes)
+        targets = np.asarray(targets, dtype=np.int64)
+        limit = np.full(num_states, UNREACHABLE, dtype=np.int32)
+        remaining = sizes.copy()
+        frontier = remaining == 0
+        level = 0
+        # One level at a time: the states whose last unsettled successors just settled
+        while frontier.any():
+            limit[frontier] = level
+            level += 1
+            remaining -= np.bincount(sources[frontier[targets]], minlength=num_states)
+            frontier = (remaining == 0) & (limit == UNREACHABLE)
+        return array('i', limit.tobytes())
+    
+    predecessors: List[List[int]] = [[] for _ in range(num_states)]
+    remaining = [0] * num_states
+    for state in range(num_states):
+        remaining[state] = offsets[state + 1] - offsets[state]
+        for position in range(offsets[state], offsets[state + 1]):
+            predecessors[targets[position]].append(state)
+    limit = array('i', [UNREACHABLE]) * num_states
+    queue = deque()
+    for state in range(num_states):
+        if not remaining[state]:
+            limit[state] = 0
+            queue.append(state)
+    # States leave the queue in order of their limits
+    while queue:
+        state = queue.popleft()
+        level = limit[state] + 1
+        for source in predecessors[state]:
+            remaining[source] -= 1
+            if not remaining[source]:
+                limit[source] = level
+                queue.append(source)
+    return limit
+
+
+def _alias_over(items: List[int], weights: List[int]) -> Optional[ItemAliasTable]:
+    """
+    Build an alias table that draws items in proportion to integer weights.
+    
+    Args:
+        items: Values to draw, such as successor positions
+        weights: Weight of each item
+        
+    Returns:
+        Alias table whose primary and alias entries are items, or None if
+        there are no items
+    """
+    if not items:
+        return None
+    thresholds, columns = build_alias(list(accumulate(weights)), 0, len(items))
+    return len(items), thresholds, items, [items[column] for column in columns]
+
+
+def _copy_array(typecode: str, data: Sequence[int]) -> array:
+    """Copy a typed array or memoryview into a new, growable array."""
+    copy = array(typecode)
+    copy.frombytes(memoryview(data).cast('B'))
+    return copy
+
+
+class StringTable(Sequence):
+    """A read-only sequence of strings decoded on demand from a UTF-8 blob."""
+    
+    def __init__(self, blob: Union[bytes, memoryview], offsets: Sequence[int]):
+        """
+        Wrap a string table.
+        
+        Args:
+            blob: Concatenated UTF-8 encoded strings
+            offsets: Start of each string in the blob; has one extra end entry
+        """
+        self.blob = blob
+        self.offsets = offsets
+    
+    @classmethod
+    def encode(cls, strings: Iterable[str]) -> 'StringTable':
+        """
+        Build a string table from strings.
+        
+        Args:
+            strings: Strings to store
+            
+        Returns:
+            String table
+        """
+        parts = [string.encode('utf-8') for string in strings]
+        offsets = array('q', [0])
+        total = 0
+        for part in parts:
+            total += len(part)
+            offsets.append(total)
+        return cls(b''.join(parts), offsets)
+    
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+
+class CompiledModel:
+    """An immutable, array-backed transition matrix over an interned vocabulary."""
+    
+    def __init__(self, vocab: List[str], offsets: Sequence[int], successors: Sequence[int],
+                 cumulative: Sequence[int], starters: Sequence[int],
+                 starter_cumulative: Sequence[int], sentence_enders: Iterable[str], order: int = 1,
+                 targets: Optional[Sequence[int]] = None,
+                 contexts: Optional[Sequence[int]] = None,
+                 flags: Optional[Sequence[int]] = None):
+        """
+        Wrap prebuilt CSR buffers.
+        
+        Args:
+            vocab: Token for each id
+            offsets: Row start of each state in successors; has one extra end entry
+            successors: Successor word ids, grouped by row
+            cumulative: Running successor counts within each row
+            starters: Distinct states recorded as sentence starters
+            starter_cumulative: Running totals of how often each starter was seen
+            sentence_enders: Suffixes that mark the end of a sentence
+            order: Number of words in each state's context
+            targets: State reached by each successor; the successors for order 1
+            contexts: Word ids of each state's context, `order` per state;
+                unused for order 1, where a state is its word id
+            flags: ENDS_SENTENCE/CAPITALIZED bits of each word; computed from
+                the vocabulary if not given
+        """
+        self.vocab = vocab
+        self.order = order
+        self.offsets = offsets
+        self.successors = successors
+        self.targets = successors if targets is None else targets
+        self.contexts = contexts
+        self.cumulative = cumulative
+        self.starters = starters
+        self.starter_cumulative = starter_cumulative
+        self.sentence_enders = tuple(sentence_enders)
+        if flags is None:
+            flags = bytearray(word_flags(word, self.sentence_enders) for word in vocab)
+        self.flags = flags
+        self._alias_tables: Dict[int, AliasTable] = {}
+        self._index: Optional[Dict[str, int]] = None
+        # Keeps a mapped file open for as long as the model uses it
+        self._buffer: Union[mmap.mmap, bytes, None] = None
+        self._start_table: Optional[Tuple[Sequence[int], Sequence[int], List[float], List[int]]] = None
+        self._batch_tables = None
+        # Steps to the nearest sentence ender and dead end, see distances()
+        self._distances: Optional[Tuple[Sequence[int], Sequence[int]]] = None
+        # Most words a walk can take from each state, see walk_limits()
+        self._walk_limits: Optional[Sequence[int]] = None
+        # (state, may_end, budget, need) -> alias table over the successors a
+        # steered walk may take; state -1 holds the table over starting states
+        self._steer_tables: Dict[Tuple[int, bool, int, int], Optional[ItemAliasTable]] = {}
+        # Rows replaced by patched(): state -> (start, end) in the successor arrays
+        self.moved: Dict[int, Tuple[int, int]] = {}
+        # Number of successor entries left behind by replaced rows
+        self._superseded = 0
+    
+    @classmethod
+    def build(cls, words: Sequence[str], transitions: Mapping[int, Mapping[int, int]],
+              sentence_starters: Mapping[int, int], sentence_enders: Iterable[str],
+              order: int = 1) -> 'CompiledModel':
+        """
+        Compile a counted transition table into CSR form.
+        
+        States that have successors get the lowest row numbers, in table
+        order, followed by states that are only ever reached or started from.
+        
+        Args:
+            words: Token for each training word id
+            transitions: Mapping of packed context key to {next word id: count}
+            sentence_starters: Mapping of packed starter context key to count
+            sentence_enders: Suffixes that mark the end of a sentence
+            order: Number of words in each context
+        
+        Returns:
+            Compiled model
+        """
+        mask = (1 << (WORD_BITS * order)) - 1
+        state_keys: List[int] = list(transitions)
+        state_of = {key: i for i, key in enumerate(state_keys)}
+        for key, next_words in transitions.items():
+            for word in next_words:
+                target = ((key << WORD_BITS) | word) & mask
+                if target not in state_of:
+                    state_of[target] = len(state_keys)
+                    state_keys.append(target)
+        
+        # Starters without successors still need a state to be chosen
+        starter_keys = list(sentence_starters)
+        for key in starter_keys:
+            if key not in state_of:
+                state_of[key] = len(state_keys)
+                state_keys.append(key)
+        
+        if order == 1:
+            # States are words: renumber the words in state order
+            vocab = [words[key] for key in state_keys]
+            word_of = state_of
+        else:
+            vocab = list(words)
+            word_of = None
+        
+        offsets = array('q', [0])
+        successors = array('i')
+        targets = array('i')
+        cumulative = array('q')
+        for key, next_words in transitions.items():
+            total = 0
+            for word, count in next_words.items():
+                total += count
+                if word_of is None:
+                    successors.append(word)
+                    targets.append(state_of[((key << WORD_BITS) | word) & mask])
+                else:
+                    successors.append(word_of[word])
+                cumulative.append(total)
+            offsets.append(len(successors))
+        # States without successors get empty rows
+        offsets.extend([len(successors)] * (len(state_keys) - len(transitions)))
+        
+        starters = array('i', (state_of[key] for key in starter_keys))
+        starter_cumulative = array('q')
+        total = 0
+        for count in sentence_starters.values():
+            total += count
+            starter_cumulative.append(total)
+        if order == 1:
+            return cls(vocab, offsets, successors, cumulative, starters, starter_cumulative,
+                       sentence_enders)
+        
+        contexts = array('i')
+        for key in state_keys:
+            contexts.extend(unpack_context(key, order))
+        return cls(vocab, offsets, successors, cumulative, starters, starter_cumulative,
+                   sentence_enders, order, targets, contexts)
+    
+    @property
+    def index(self) -> Dict[str, int]:
+        """Mapping of word to id, built on first use."""
+        if self._index is None:
+            self._index = {word: i for i, word in enumerate(self.vocab)}
+        return self._index
+    
+    @property
+    def num_states(self) -> int:
+        """Number of states, including those without successors."""
+        return len(self.offsets) - 1
+    
+    @property
+    def num_transitions(self) -> int:
+        """Number of distinct (context, next_word) pairs."""
+        return len(self.successors) - self._superseded
+    
+    def row(self, state: int) -> Tuple[int, int]:
+        """
+        Get where a state's successors are stored.
+        
+        Args:
+            state: State number
+            
+        Returns:
+            Start and end position in the successor arrays
+        """
+        moved = self.moved.get(state)
+        if moved is not None:
+            return moved
+        return self.offsets[state], self.offsets[state + 1]
+    
+    def state_words(self, state: int) -> List[int]:
+        """
+        Get the word ids of a state's context.
+        
+        Args:
+            state: State number
+            
+        Returns:
+            Word ids, oldest first
+        """
+        if self.order == 1:
+            return [state]
+        return list(self.contexts[state * self.order:(state + 1) * self.order])
+    
+    def successor_counts(self, current: int) -> Dict[int, int]:
+        """
+        Get the successor words of a state with their counts.
+        
+        Args:
+            current: Current state
+            
+        Returns:
+            Mapping of successor id to count, in training order
+        """
+        lo, hi = self.row(current)
+        counts = {}
+        previous = 0
+        for i in range(lo, hi):
+            counts[self.successors[i]] = self.cumulative[i] - previous
+            previous = self.cumulative[i]
+        return counts
+    
+    def choose_start(self, rng=random) -> int:
+        """
+        Choose a good starting state.
+        
+        Recorded sentence starters are drawn in proportion to how often they
+        were seen. Without any, a state with successors whose first word is
+        capitalized is drawn uniformly, and failing that any state with
+        successors.
+        
+        Args:
+            rng: Source of randomness
+            
+        Returns:
+            Starting state
+        """
+        states, _, thresholds, aliases = self.start_table()
+        u = rng.random() * len(states)
+        column = int(u)
+        return states[column if u - column < thresholds[column] else aliases[column]]
+        
+    def start_table(self) -> Tuple[Sequence[int], Sequence[int], List[float], List[int]]:
+        """
+        Get the sampling table for starting states, building it on first use.
+        
+        Returns:
+            Candidate states, their cumulative weights, and the alias table
+            thresholds and aliases over them
+        """
+        if self._start_table is None:
+            if len(self.starters):
+                states = self.starters
+                cumulative = self.starter_cumulative
+            else:
+                # Fallback to any state whose first word starts with a capital letter
+                flags = self.flags
+                states = []
+                for i in range(self.num_states):
+                    lo, hi = self.row(i)
+                    if hi > lo:
+                        states.append(i)
+                capitalized = [i for i in states if flags[self.state_words(i)[0]] & CAPITALIZED]
+                states = capitalized or states
+                cumulative = range(1, len(states) + 1)
+            thresholds, aliases = build_alias(cumulative, 0, len(states))
+            self._start_table = (states, cumulative, thresholds, aliases)
+        return self._start_table
+    
+    def alias_table(self, current: int) -> AliasTable:
+        """
+        Get the Walker/Vose alias table for a state, building it on first use.
+        
+        Args:
+            current: Current state
+        
+        Returns:
+            Alias table; its column count is 0 if the state has no successors
+        """
+        table = self._alias_tables.get(current)
+        if table is not None:
+            return table
+        
+        lo, hi = self.row(current)
+        thresholds, aliases = build_alias(self.cumulative, lo, hi)
+        table = (hi - lo, thresholds, lo, aliases)
+        self._alias_tables[current] = table
+        return table
+    
+    def next_id(self, current: int, rng=random) -> int:
+        """
+        Sample the next word of a state in proportion to its count.
+        
+        Args:
+            current: Current state
+            rng: Source of randomness
+        
+        Returns:
+            Id of the next word, or -1 if the state has no successors
+        """
+        table = self._alias_tables.get(current)
+        if table is None:
+            table = self.alias_table(current)
+        n, thresholds, lo, aliases = table
+        if not n:
+            return -1
+        u = rng.random() * n
+        column = int(u)
+        return self.successors[lo + column if u - column < thresholds[column]
+                               else aliases[column]]
+    
+    def next_id_bisect(self, current: int, rng=random) -> int:
+        """
+        Sample the next word of a state by bisecting its cumulative counts.
+        
+        This costs O(log n) per draw but needs no per-state table.
+        
+        Args:
+            current: Current state
+            rng: Source of randomness
+        
+        Returns:
+            Id of the next word, or -1 if the state has no successors
+        """
+        lo, hi = self.row(current)
+        if lo == hi:
+            return -1
+        r = rng.randrange(self.cumulative[hi - 1])
+        return self.successors[bisect_right(self.cumulative, r, lo, hi)]
+    
+    def generate_ids(self, start: int, max_length: int = 100, min_length: int = 20,
+                     rng=random) -> List[int]:
+        """
+        Walk the chain from a starting state.
+        
+        Args:
+            start: Starting state; its context words open the output
+            max_length: Maximum number of words to generate
+            min_length: Minimum number of words before allowing natural endings
+            rng: Source of randomness
+        
+        Returns:
+            Generated word ids
+        """
+        tables = self._alias_tables
+        successors = self.successors
+        targets = self.targets
+        flags = self.flags
+        uniform = rng.random
+        
+        ids = self.state_words(start)
+        current = start
+        for length in range(len(ids) + 1, max_length + 1):
+            table = tables.get(current)
+            if table is None:
+                table = self.alias_table(current)
+            n, thresholds, lo, aliases = table
+            if not n:
+                # No more transitions possible
+                break
+            
+            u = uniform() * n
+            column = int(u)
+            position = lo + column if u - column < thresholds[column] else aliases[column]
+            word = successors[position]
+            current = targets[position]
+            ids.append(word)
+            
+            # Check for natural ending after minimum length
+            if length > min_length and flags[word] & ENDS_SENTENCE:
+                break
+        return ids
+    
+    def iter_ids(self, start: int, max_length: int = 100, min_length: int = 20,
+                 rng=random) -> Iterator[int]:
+        """
+        Walk the chain from a starting state, yielding each word id as it is drawn.
+        
+        Draws exactly as generate_ids does, so the same rng state gives the
+        same ids.
+        
+        Args:
+            start: Starting state; its context words are yielded first
+            max_length: Maximum number of words to generate
+            min_length: Minimum number of words before allowing natural endings
+            rng: Source of randomness
+            
+        Yields:
+            Word ids
+        """
+        tables = self._alias_tables
+        successors = self.successors
+        targets = self.targets
+        flags = self.flags
+        uniform = rng.random
+        
+        context = self.state_words(start)
+        yield from context
+        current = start
+        for length in range(len(context) + 1, max_length + 1):
+            table = tables.get(current)
+            if table is None:
+                table = self.alias_table(current)
+            n, thresholds, lo, aliases = table
+            if not n:
+                return
+            
+            u = uniform() * n
+            column = int(u)
+            position = lo + column if u - column < thresholds[column] else aliases[column]
+            word = successors[position]
+            current = targets[position]
+            yield word
+            
+            if length > min_length and flags[word] & ENDS_SENTENCE:
+                return
+    
+    def generate_batch(self, count: int, max_length: int = 100, min_length: int = 20,
+                       rng=None) -> List[List[int]]:
+        """
+        Walk many chains at once.
+        
+        With NumPy the chains advance in lockstep: every step draws one array
+        of random numbers for the live chains, finds each successor with a
+        single searchsorted over the globally accumulated counts, and masks out
+        chains that have reached a dead end or a natural ending. Without NumPy
+        the chains are generated one at a time.
+        
+        Args:
+            count: Number of chains
+            max_length: Maximum number of words per chain
+            min_length: Minimum number of words before allowing natural endings
+            rng: NumPy Generator (a random.Random without NumPy); defaults to
+                one seeded from the random module
+                
+        Returns:
+            Generated word ids for each chain
+        """
+        if np is None:
+            rng = rng or random
+            return [self.generate_ids(self.choose_start(rng), max_length, min_length, rng)
+                    for _ in range(count)]
+        chains, _, lengths = self.walk_batch(count, max_length, min_length, rng)
+        return [chain[:length].tolist() for chain, length in zip(chains, lengths)]
+    
+    def walk_batch(self, count: int, max_length: int = 100, min_length: int = 20,
+                   rng=None) -> Tuple['np.ndarray', 'np.ndarray', 'np.ndarray']:
+        """
+        Walk many chains in lockstep with NumPy, keeping the padded arrays.
+        
+        Draws exactly as generate_batch does. The position of every drawn
+        transition is kept too, so the walks can be scored without looking
+        their transitions up again (see synopsis_scoring).
+        
+        Args:
+            count: Number of chains
+            max_length: Maximum number of words per chain
+            min_length: Minimum number of words before allowing natural endings
+            rng: NumPy Generator; defaults to one seeded from the random module
+            
+        Returns:
+            Word ids of each chain, padded to the same width; for each word
+            after the starting context, the position of its transition in the
+            rows of compacted(), or -1 past the end of the chain; and the
+            length of each chain
+        """
+        if rng is None:
+            rng = np.random.default_rng(random.getrandbits(64))
+        
+        offsets, successors, targets, contexts, accumulated, row_base, is_ender = \
+            self._get_batch_tables()
+        order = self.order
+        states, weights, _, _ = self.start_table()
+        weights = np.asarray(weights, dtype=np.int64)
+        draws = rng.integers(weights[-1], size=count)
+        current = np.asarray(states, dtype=np.int64)[np.searchsorted(weights, draws, side='right')]
+        
+        width = max(max_length, order)
+        chains = np.empty((count, width), dtype=np.int64)
+        chains[:, :order] = contexts[current]
+        drawn = np.full((count, width - order), -1, dtype=np.int64)
+        lengths = np.full(count, order, dtype=np.int64)
+        live = np.arange(count)
+        
+        for step in range(order, max_length):
+            lo = offsets[current]
+            hi = offsets[current + 1]
+            # Chains without transitions stop here
+            moving = hi > lo
+            if not moving.all():
+                live, current, lo, hi = live[moving], current[moving], lo[moving], hi[moving]
+            if not live.size:
+                break
+            
+            base = row_base[current]
+            draws = base + rng.integers(accumulated[hi - 1] - base)
+            positions = np.searchsorted(accumulated, draws, side='right')
+            words = successors[positions]
+            current = targets[positions]
+            chains[live, step] = words
+            drawn[live, step - order] = positions
+            lengths[live] += 1
+            
+            # Check for natural ending after minimum length
+            if step >= min_length:
+                going = ~is_ender[words]
+                live, current = live[going], current[going]
+        
+        return chains, drawn, lengths
+    
+    def _get_batch_tables(self):
+        """
+        Build the NumPy views used by generate_batch.
+        
+        The row-local cumulative counts are shifted by the total of all earlier
+        rows, so one searchsorted over the whole array can serve every chain.
+        Rows replaced by patched() are gathered back into CSR order first.
+        """
+        if self._batch_tables is None:
+            offsets = np.asarray(self.offsets, dtype=np.int64)
+            successors = np.asarray(self.successors, dtype=np.int64)
+            targets = np.asarray(self.targets, dtype=np.int64)
+            cumulative = np.asarray(self.cumulative, dtype=np.int64)
+            if self.moved:
+                starts = offsets[:-1].copy()
+                ends = offsets[1:].copy()
+                moved = np.array(list(self.moved), dtype=np.int64)
+                rows = np.array(list(self.moved.values()), dtype=np.int64)
+                starts[moved] = rows[:, 0]
+                ends[moved] = rows[:, 1]
+                sizes = ends - starts
+                offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+                np.cumsum(sizes, out=offsets[1:])
+                gather = np.repeat(starts - offsets[:-1], sizes) + np.arange(offsets[-1])
+                successors = successors[gather]
+                targets = targets[gather]
+                cumulative = cumulative[gather]
+            if self.order == 1:
+                contexts = np.arange(self.num_states, dtype=np.int64).reshape(-1, 1)
+            else:
+                contexts = np.asarray(self.contexts, dtype=np.int64).reshape(-1, self.order)
+            
+            row_sizes = np.diff(offsets)
+            row_totals = np.zeros(len(row_sizes), dtype=np.int64)
+            nonempty = row_sizes > 0
+            row_totals[nonempty] = cumulative[offsets[1:][nonempty] - 1]
+            row_base = np.zeros(len(row_sizes), dtype=np.int64)
+            np.cumsum(row_totals[:-1], out=row_base[1:])
+            accumulated = cumulative + np.repeat(row_base, row_sizes)
+            
+            is_ender = (np.frombuffer(self.flags, dtype=np.uint8) & ENDS_SENTENCE) != 0
+            self._batch_tables = (offsets, successors, targets, contexts, accumulated,
+                                  row_base, is_ender)
+        return self._batch_tables
+    
+    def distances(self) -> Tuple[Sequence[int], Sequence[int]]:
+        """
+        Get how far each state is from a sentence ender and from a dead end.
+        
+        A dead end is a state without successors, such as the context at the
+        very end of the corpus, where a walk stops whatever its length. The
+        analysis runs once per model, with one breadth-first search backwards
+        from each kind of target, and is stored in saved model files.
+        
+        Returns:
+            For every state, the fewest words to generate until one ends a
+            sentence, and the fewest until the walk reaches a dead end (0 for
+            dead ends themselves); UNREACHABLE where there is no such path
+        """
+        if self._distances is None:
+            model = self.compacted()
+            offsets = model.offsets
+            successors = model.successors
+            flags = self.flags
+            enders = [state for state in range(self.num_states)
+                      if any(flags[successors[position]] & ENDS_SENTENCE
+                             for position in range(offsets[state], offsets[state + 1]))]
+            dead_ends = [state for state in range(self.num_states)
+                         if offsets[state] == offsets[state + 1]]
+            self._distances = (reverse_distances(offsets, model.targets, enders, 1),
+                               reverse_distances(offsets, model.targets, dead_ends, 0))
+        return self._distances
+    
+    def walk_limits(self) -> Sequence[int]:
+        """
+        Get how many words a walk can still generate from each state.
+        
+        distances() tells how soon a walk may reach a dead end; this tells
+        how long it can keep away from one. Steered walks use it to keep
+        going until min_length. It is computed once per model and stored in
+        saved model files.
+        
+        Returns:
+            For every state, the most words a walk from it can generate before
+            it reaches a dead end (0 for dead ends themselves), or UNREACHABLE
+            if it can go on forever
+        """
+        if self._walk_limits is None:
+            model = self.compacted()
+            self._walk_limits = walk_limits(model.offsets, model.targets)
+        return self._walk_limits
+    
+    def _steer_table(self, current: int, may_end: bool, budget: int,
+                     need: int = 0) -> Optional[ItemAliasTable]:
+        """
+        Get the alias table over a state's successors from which a sentence
+        ender can be reached within a budget, and from which the walk can
+        keep going for a number of words.
+        
+        Args:
+            current: Current state, or -1 for the starting states
+            may_end: Whether a sentence ender may end the walk here, in which
+                case successors that end a sentence are kept as well
+            budget: Most words that may follow the drawn one; UNREACHABLE - 1
+                only drops traps, states from which no ender can be reached
+                (dead ends among them)
+            need: Fewest words that must be able to follow the drawn one
+                
+        Returns:
+            Alias table over the kept successor positions (starting states for
+            -1), or None if none are kept
+        """
+        key = (current, may_end, budget, need)
+        if key in self._steer_tables:
+            return self._steer_tables[key]
+        to_ender = self.distances()[0]
+        limits = self.walk_limits()
+        kept = []
+        weights = []
+        previous = 0
+        if current < 0:
+            states, cumulative, _, _ = self.start_table()
+            for state, total in zip(states, cumulative):
+                if to_ender[state] <= budget and limits[state] >= need:
+                    kept.append(state)
+                    weights.append(total - previous)
+                previous = total
+        else:
+            successors = self.successors
+            targets = self.targets
+            flags = self.flags
+            cumulative = self.cumulative
+            lo, hi = self.row(current)
+            for position in range(lo, hi):
+                target = targets[position]
+                if to_ender[target] <= budget and limits[target] >= need or (
+                        may_end and flags[successors[position]] & ENDS_SENTENCE):
+                    kept.append(position)
+                    weights.append(cumulative[position] - previous)
+                previous = cumulative[position]
+        table = self._steer_tables[key] = _alias_over(kept, weights)
+        return table
+    
+    def generate_ids_steered(self, start: int, max_length: int = 100, min_length: int = 20,
+                             rng=random, fit_length: bool = False) -> List[int]:
+        """
+        Walk the chain like generate_ids, but steer clear of early endings.
+        
+        Whenever the drawn successor leads into a state from which no
+        sentence ender can be reached, or from which every walk reaches a dead
+        end before min_length (see walk_limits), it is drawn again from the
+        successors that do not, in proportion to their counts. Successors
+        that end a sentence once min_length is reached are always fine. The
+        walk thus only ends early when every way forward is a trap.
+        
+        With fit_length, the same redraw also applies to successors from which
+        the nearest sentence ender is further away than the words left before
+        max_length. Far from the limit this only drops traps; near it, the
+        walk is drawn toward a sentence it can finish, and on the last word
+        toward an ender, instead of being cut off mid-sentence.
+        
+        Args:
+            start: Starting state; its context words open the output
+            max_length: Maximum number of words to generate
+            min_length: Minimum number of words before allowing natural endings
+            rng: Source of randomness
+            fit_length: Steer toward a natural ending by max_length
+            
+        Returns:
+            Generated word ids
+        """
+        tables = self._alias_tables
+        successors = self.successors
+        targets = self.targets
+        flags = self.flags
+        to_ender = self.distances()[0]
+        limits = self.walk_limits()
+        uniform = rng.random
+        budget = UNREACHABLE - 1
+        # Number of words the walk must be able to reach
+        floor = min(min_length, max_length - 1) + 1
+        
+        ids = self.state_words(start)
+        current = start
+        for length in range(len(ids) + 1, max_length + 1):
+            table = tables.get(current)
+            if table is None:
+                table = self.alias_table(current)
+            n, thresholds, lo, aliases = table
+            if not n:
+                break
+            
+            u = uniform() * n
+            column = int(u)
+            position = lo + column if u - column < thresholds[column] else aliases[column]
+            word = successors[position]
+            may_end = length > min_length
+            need = max(floor - length, 0)
+            if fit_length:
+                budget = max_length - length
+            elif length == max_length:
+                # The walk stops after this word anyway
+                budget = UNREACHABLE
+            target = targets[position]
+            if (to_ender[target] > budget or limits[target] < need) and not (
+                    may_end and flags[word] & ENDS_SENTENCE):
+                steered = self._steer_table(current, may_end, budget, need)
+                if steered is not None:
+                    n, thresholds, primary, aliases = steered
+                    u = uniform() * n
+                    column = int(u)
+                    position = (primary[column] if u - column < thresholds[column]
+                                else aliases[column])
+                    word = successors[position]
+                    target = targets[position]
+            current = target
+            ids.append(word)
+            
+            if may_end and flags[word] & ENDS_SENTENCE:
+                break
+        return ids
+    
+    def choose_start_steered(self, rng=random, max_length: int = 100, min_length: int = 20,
+                             fit_length: bool = False) -> int:
+        """
+        Choose a starting state like generate_ids_steered draws a successor.
+        
+        Args:
+            rng: Source of randomness
+            max_length: Maximum number of words to generate
+            min_length: Minimum number of words before allowing natural endings
+            fit_length: Also avoid starting states whose nearest sentence
+                ender lies beyond max_length
+            
+        Returns:
+            Starting state
+        """
+        start = self.choose_start(rng)
+        # Every starting state holds `order` words
+        words = self.order
+        budget = max_length - words if fit_length else UNREACHABLE - 1
+        need = max(min(min_length, max_length - 1) + 1 - words, 0)
+        if self.distances()[0][start] <= budget and self.walk_limits()[start] >= need:
+            return start
+        table = self._steer_table(-1, False, budget, need)
+        if table is None:
+            return start
+        n, thresholds, primary, aliases = table
+        u = rng.random() * n
+        column = int(u)
+        return primary[column] if u - column < thresholds[column] else aliases[column]
+    
+    def patched(self, words: Sequence[str], transitions: Mapping[int, Mapping[int, int]],
+                changed: Iterable[int], sentence_starters: Optional[Mapping[int, int]],
+                state_of: Dict[int, int]) -> 'CompiledModel':
+        """
+        Derive a model in which the rows of some states are replaced.
+        
+        The replacement rows, and the rows of any new states, are appended to
+        copies of the successor arrays and found through `moved`; the rows
+        they replace stay behind unused until the model is compacted. Every
+        other state keeps its position, so its alias table is carried over
+        and only the changed states build theirs again. This model is left
+        untouched.
+        
+        The arrays, vocabulary and flags are copied, so each patch still costs
+        time and memory in proportion to the whole model. Tables derived from
+        the whole graph are not patched: the batch tables of walk_batch,
+        distances(), walk_limits() and the steered tables are built again on
+        first use, so the first batch after an update pays for all of them.
+        
+        Args:
+            words: Token for each training word id
+            transitions: Mapping of packed context key to {next word id: count},
+                with the changes already applied
+            changed: Packed context keys whose successor counts changed
+            sentence_starters: Mapping of packed starter context key to count,
+                or None if the starters did not change
+            state_of: Mapping of packed context key to state of this model;
+                new states are added to it
+                
+        Returns:
+            Patched model
+        """
+        order = self.order
+        mask = (1 << (WORD_BITS * order)) - 1
+        enders = self.sentence_enders
+        vocab = list(self.vocab)
+        flags = bytearray(self.flags)
+        offsets = _copy_array('q', self.offsets)
+        successors = _copy_array('i', self.successors)
+        cumulative = _copy_array('q', self.cumulative)
+        if order == 1:
+            targets = successors
+            contexts = None
+        else:
+            targets = _copy_array('i', self.targets)
+            contexts = _copy_array('i', self.contexts)
+            # Word ids are the training ids: take on every new word
+            for word in words[len(vocab):]:
+                vocab.append(word)
+                flags.append(word_flags(word, enders))
+        moved = dict(self.moved)
+        superseded = self._superseded
+        
+        def add_state(key: int) -> int:
+            state = len(offsets) - 1
+            state_of[key] = state
+            offsets.append(offsets[-1])
+            if order == 1:
+                # States are words: the new word takes the next id
+                vocab.append(words[key])
+                flags.append(word_flags(words[key], enders))
+            else:
+                contexts.extend(unpack_context(key, order))
+            return state
+        
+        changed_states = set()
+        for key in changed:
+            state = state_of.get(key)
+            if state is None:
+                state = add_state(key)
+            else:
+                lo, hi = moved.get(state) or (offsets[state], offsets[state + 1])
+                superseded += hi - lo
+            changed_states.add(state)
+            
+            lo = len(successors)
+            total = 0
+            for word, count in transitions[key].items():
+                target_key = ((key << WORD_BITS) | word) & mask
+                target = state_of.get(target_key)
+                if target is None:
+                    target = add_state(target_key)
+                total += count
+                if order == 1:
+                    successors.append(target)
+                else:
+                    successors.append(word)
+                    targets.append(target)
+                cumulative.append(total)
+            moved[state] = (lo, len(successors))
+        
+        if sentence_starters is None:
+            starters = self.starters
+            starter_cumulative = self.starter_cumulative
+        else:
+            starters = array('i')
+            for key in sentence_starters:
+                state = state_of.get(key)
+                starters.append(add_state(key) if state is None else state)
+            starter_cumulative = array('q', accumulate(sentence_starters.values()))
+        
+        model = CompiledModel(vocab, offsets, successors, cumulative, starters,
+                              starter_cumulative, enders, order,
+                              None if order == 1 else targets, contexts, flags)
+        model.moved = moved
+        model._superseded = superseded
+        model._alias_tables = {state: table for state, table in self._alias_tables.items()
+                               if state not in changed_states}
+        if self._index is not None:
+            model._index = dict(self._index)
+            for i in range(len(self.vocab), len(vocab)):
+                model._index[vocab[i]] = i
+        if sentence_starters is None and len(starters):
+            model._start_table = self._start_table
+        return model
+    
+    def compacted(self) -> 'CompiledModel':
+        """
+        Get a copy with every row back in CSR order and no unused entries.
+        
+        States keep their numbers; only the positions of their successors
+        change, so the alias tables are built again on use.
+        
+        Returns:
+            Compacted model, or this model if nothing was ever replaced
+        """
+        if not self.moved:
+            return self
+        offsets = array('q', [0])
+        successors = array('i')
+        targets = array('i')
+        cumulative = array('q')
+        for state in range(self.num_states):
+            lo, hi = self.row(state)
+            successors.frombytes(memoryview(self.successors[lo:hi]).cast('B'))
+            cumulative.frombytes(memoryview(self.cumulative[lo:hi]).cast('B'))
+            if self.order > 1:
+                targets.frombytes(memoryview(self.targets[lo:hi]).cast('B'))
+            offsets.append(len(successors))
+        model = CompiledModel(self.vocab, offsets, successors, cumulative, self.starters,
+                              self.starter_cumulative, self.sentence_enders, self.order,
+                              None if self.order == 1 else targets, self.contexts, self.flags)
+        model._index = self._index
+        model._start_table = self._start_table
+        model._distances = self._distances
+        model._walk_limits = self._walk_limits
+        return model
+    
+    def decode(self, ids: Iterable[int]) -> List[str]:
+        """
+        Turn word ids back into strings.
+        
+        Args:
+            ids: Word ids
+        
+        Returns:
+            List of words
+        """
+        vocab = self.vocab
+        return [vocab[i] for i in ids]
+
+    def render(self, ids: Sequence[int]) -> str:
+        """
+        Turn generated word ids into finished text in one pass.
+        
+        Spacing and capitalization are decided from the word flags, and the
+        pieces are joined once. The result is the same as running the
+        space-joined words through BookSynopsisGenerator._post_process_text
+        with this model's sentence enders, provided none of them contains
+        whitespace.
+        
+        Args:
+            ids: Word ids
+            
+        Returns:
+            Finished text
+        """
+        if not len(ids):
+            return ''
+        vocab = self.vocab
+        flags = self.flags
+        parts = []
+        append = parts.append
+        for word_id in ids:
+            word = vocab[word_id]
+            bits = flags[word_id]
+            if bits & INNER_BREAK:
+                word = break_sentences(word)
+            if parts and not bits & JOINS_PREVIOUS:
+                append(' ')
+            append(word)
+        if not flags[ids[-1]] & ENDS_SENTENCE:
+            append('.')
+        first = parts[0]
+        parts[0] = first[0].upper() + first[1:]
+        return ''.join(parts)
+    
+    def iter_render(self, ids: Iterable[int]) -> Iterator[str]:
+        """
+        Render word ids one at a time, as they arrive.
+        
+        Each piece is a word with the space before it, if any; a final '.'
+        follows when the last word does not end a sentence. Joined, the
+        pieces equal render() of the same ids.
+        
+        Args:
+            ids: Word ids, possibly still being generated
+            
+        Yields:
+            Pieces of the finished text
+        """
+        vocab = self.vocab
+        flags = self.flags
+        bits = ENDS_SENTENCE
+        first = True
+        for word_id in ids:
+            word = vocab[word_id]
+            bits = flags[word_id]
+            if bits & INNER_BREAK:
+                word = break_sentences(word)
+            if first:
+                word = word[0].upper() + word[1:]
+                first = False
+            elif not bits & JOINS_PREVIOUS:
+                word = ' ' + word
+            yield word
+        if not bits & ENDS_SENTENCE:
+            yield '.'
+    
+    def save(self, path: str) -> None:
+        """
+        Write the model to a versioned binary file.
+        
+        The file is written next to its destination and renamed into place,
+        so readers never see a partially written model.
+        
+        Args:
+            path: Destination path
+        """
+        if self.moved:
+            self.compacted().save(path)
+            return
+        vocab = self.vocab
+        if not isinstance(vocab, StringTable):
+            vocab = StringTable.encode(vocab)
+        enders = StringTable.encode(self.sentence_enders)
+        to_ender, to_dead_end = self.distances()
+        limits = self.walk_limits()
+        sections = [
+            (b'meta', 'q', array('q', [self.order])),
+            (b'vocabidx', 'q', vocab.offsets),
+            (b'vocab', 'B', vocab.blob),
+            (b'offsets', 'q', self.offsets),
+            (b'succ', 'i', self.successors),
+            (b'cumul', 'q', self.cumulative),
+            (b'starters', 'i', self.starters),
+            (b'startcum', 'q', self.starter_cumulative),
+            (b'endidx', 'q', enders.offsets),
+            (b'enders', 'B', enders.blob),
+            (b'flags', 'B', self.flags),
+            (b'toender', 'i', to_ender),
+            (b'todead', 'i', to_dead_end),
+            (b'walklim', 'i', limits),
+        ]
+        if self.order > 1:
+            sections.append((b'targets', 'i', self.targets))
+            sections.append((b'contexts', 'i', self.contexts))
+        
+        position = _HEADER.size + _SECTION.size * len(sections)
+        entries = []
+        for name, typecode, data in sections:
+            position = (position + 7) & ~7
+            entries.append((name, typecode, position, len(data)))
+            position += len(data) * array(typecode).itemsize
+        
+        temporary = f"{path}.tmp{os.getpid()}"
+        with open(temporary, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, _BYTE_ORDER_MARK, FORMAT_VERSION, len(sections)))
+            for name, typecode, offset, count in entries:
+                f.write(_SECTION.pack(name, typecode.encode(), offset, count))
+            for (_, _, offset, _), (_, typecode, data) in zip(entries, sections):
+                f.write(b'\0' * (offset - f.tell()))
+                f.write(data)
+        os.replace(temporary, path)
+    
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'CompiledModel':
+        """
+        Open a model written by save().
+        
+        With mmap the file is memory-mapped and its arrays are used in place,
+        so the model is ready without parsing and processes that load the
+        same file share one page-cached copy.
+        
+        Args:
+            path: Path of the model file
+            mmap: Map the file instead of reading it into memory
+            
+        Returns:
+            Compiled model
+            
+        Raises:
+            ValueError: If the file is not a model this version can read
+        """
+        buffer = _read_file(path, mmap)
+        view = memoryview(buffer)
+        if len(view) < _HEADER.size:
+            raise ValueError(f"{path} is not a synopsis model file")
+        magic, byte_order, version, count = _HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a synopsis model file")
+        if byte_order != _BYTE_ORDER_MARK:
+            raise ValueError(f"{path} was written on a machine with a different byte order")
+        if not 1 <= version <= FORMAT_VERSION:
+            raise ValueError(f"{path} has unsupported format version {version}")
+        
+        sections = {}
+        for i in range(count):
+            name, typecode, offset, length = _SECTION.unpack_from(
+                view, _HEADER.size + i * _SECTION.size)
+            typecode = typecode.decode()
+            size = length * array(typecode).itemsize
+            sections[name.rstrip(b'\0')] = view[offset:offset + size].cast(typecode)
+        
+        vocab = StringTable(sections[b'vocab'], sections[b'vocabidx'])
+        enders = StringTable(sections[b'enders'], sections[b'endidx'])
+        # Version 1 files hold order-1 models only
+        order = sections[b'meta'][0] if b'meta' in sections else 1
+        starters = sections[b'starters']
+        starter_cumulative = sections.get(b'startcum')
+        if starter_cumulative is None:
+            # Versions 1 and 2 list every starter occurrence; count them here
+            counts: Dict[int, int] = {}
+            for state in starters:
+                counts[state] = counts.get(state, 0) + 1
+            starters = array('i', counts)
+            starter_cumulative = array('q', accumulate(counts.values()))
+        # Files before version 4 lack the JOINS_PREVIOUS/INNER_BREAK bits
+        flags = sections.get(b'flags') if version >= 4 else None
+        model = cls(vocab, sections[b'offsets'], sections[b'succ'], sections[b'cumul'],
+                    starters, starter_cumulative, enders, order, sections.get(b'targets'),
+                    sections.get(b'contexts'), flags)
+        if b'toender' in sections:
+            # Versions before 5 get their distances computed on first use
+            model._distances = (sections[b'toender'], sections[b'todead'])
+        if b'walklim' in sections:
+            model._walk_limits = sections[b'walklim']
+        model._buffer = buffer
+        return model
+
+
+def _read_file(path: str, use_mmap: bool) -> Union[mmap.mmap, bytes]:
+    """Memory-map a file read-only, or read it into memory."""
+    with open(path, 'rb') as f:
+        if use_mmap:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return f.read()
@@ -0,0 +1,268 @@
+"""
+Native Sampling Kernel
+
+This module walks whole synopses in a small C kernel over the compiled
+model's arrays. The kernel is compiled with the system C compiler the first
+time it is needed and cached on disk; it is loaded with ctypes, which releases
+the GIL for the duration of every call, so a batch split across a thread
+pool runs on several cores inside one process.
+
+Chain i of a batch draws from its own xoshiro256** stream seeded from the
+batch seed and i, so a seed gives the same chains however the batch is split
+across threads. The streams differ from the random module's and NumPy's, so
+the native and pure-Python paths give different (equally distributed)
+chains for the same seed.
+
+Everything here is optional: when no compiler is available, available()
+returns False and callers keep using CompiledModel.generate_batch.
+"""
+
+import ctypes
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import weakref
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from synopsis_model import CompiledModel
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; read-only arrays are copied instead
+    np = None
+
+_SOURCE = r"""
+#include <stdint.h>
+
+typedef struct { uint64_t s[4]; } rng_t;
+
+static uint64_t splitmix64(uint64_t *x) {
+    uint64_t z = (*x += 0x9E3779B97F4A7C15ULL);
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+    return z ^ (z >> 31);
+}
+
+static uint64_t rotl(uint64_t x, int k) { return (x << k) | (x >> (64 - k)); }
+
+static uint64_t next_u64(rng_t *r) {
+    uint64_t *s = r->s;
+    uint64_t result = rotl(s[1] * 5, 7) * 9;
+    uint64_t t = s[1] << 17;
+    s[2] ^= s[0]; s[3] ^= s[1]; s[1] ^= s[2]; s[0] ^= s[3];
+    s[2] ^= t;
+    s[3] = rotl(s[3], 45);
+    return result;
+}
+
+/* Uniform integer in [0, n) */
+static int64_t below(rng_t *r, int64_t n) {
+#ifdef __SIZEOF_INT128__
+    return (int64_t)(((unsigned __int128)next_u64(r) * (uint64_t)n) >> 64);
+#else
+    return (int64_t)(next_u64(r) % (uint64_t)n);
+#endif
+}
+
+/* First position in [lo, hi) whose running count exceeds r */
+static int64_t upper_bound(const int64_t *a, int64_t lo, int64_t hi, int64_t r) {
+    while (lo < hi) {
+        int64_t mid = lo + (hi - lo) / 2;
+        if (a[mid] <= r) lo = mid + 1; else hi = mid;
+    }
+    return lo;
+}
+
+void bsg_walk(const int64_t *offsets, const int32_t *successors, const int32_t *targets,
+              const int64_t *cumulative, const uint8_t *flags, const int32_t *contexts,
+              int32_t order, const int32_t *starts, const int64_t *start_cumulative,
+              int64_t num_starts, uint64_t seed, int64_t first, int64_t count,
+              int32_t max_length, int32_t min_length, int32_t width,
+              int32_t *out, int32_t *lengths) {
+    for (int64_t i = first; i < first + count; i++) {
+        rng_t rng;
+        uint64_t index = (uint64_t)i;
+        uint64_t x = seed ^ splitmix64(&index);
+        for (int k = 0; k < 4; k++) rng.s[k] = splitmix64(&x);
+        int32_t *ids = out + i * width;
+        int64_t r = below(&rng, start_cumulative[num_starts - 1]);
+        int32_t state = starts[upper_bound(start_cumulative, 0, num_starts, r)];
+        int32_t length = order;
+        if (order == 1) {
+            ids[0] = state;
+        } else {
+            for (int32_t k = 0; k < order; k++) ids[k] = contexts[(int64_t)state * order + k];
+        }
+        while (length < max_length) {
+            int64_t lo = offsets[state], hi = offsets[state + 1];
+            if (lo == hi) break;  /* No more transitions possible */
+            int64_t p = upper_bound(cumulative, lo, hi, below(&rng, cumulative[hi - 1]));
+            int32_t word = successors[p];
+            state = targets[p];
+            ids[length++] = word;
+            /* Natural ending after the minimum length */
+            if (length > min_length && (flags[word] & 1)) break;
+        }
+        lengths[i] = length;
+    }
+}
+"""
+
+_lock = threading.Lock()
+_library = None
+_failed = False
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_size = 0
+# Native views of each model's arrays, dropped with the model
+_tables: 'weakref.WeakKeyDictionary[CompiledModel, tuple]' = weakref.WeakKeyDictionary()
+
+
+def _cache_dir() -> str:
+    """Directory the compiled kernel is kept in."""
+    explicit = os.environ.get('BSG_NATIVE_CACHE')
+    if explicit:
+        return explicit
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'book_synopsis')
+
+
+def _load_library():
+    """Compile the kernel if it is not cached yet and load it, or return None."""
+    global _library, _failed
+    with _lock:
+        if _library is not None or _failed:
+            return _library
+        try:
+            compiler = os.environ.get('CC', 'cc')
+            digest = hashlib.sha256(f"{_SOURCE}{compiler}{sys.platform}".encode()).hexdigest()
+            directory = _cache_dir()
+            path = os.path.join(directory, f"bsg_kernel_{digest[:16]}.so")
+            if not os.path.exists(path):
+                os.makedirs(directory, exist_ok=True)
+                with tempfile.TemporaryDirectory(dir=directory) as tmp:
+                    source = os.path.join(tmp, 'bsg_kernel.c')
+                    with open(source, 'w') as f:
+                        f.write(_SOURCE)
+                    built = os.path.join(tmp, 'bsg_kernel.so')
+                    subprocess.run([compiler, '-O3', '-std=c99', '-shared', '-fPIC', '-o', built,
+                                    source], check=True, capture_output=True)
+                    # Concurrent builders may race; the rename is atomic
+                    os.replace(built, path)
+            library = ctypes.CDLL(path)
+        except (OSError, subprocess.CalledProcessError):
+            _failed = True
+            return None
+        i32, i64, u64 = ctypes.c_int32, ctypes.c_int64, ctypes.c_uint64
+        pointer = ctypes.c_void_p
+        library.bsg_walk.argtypes = [pointer, pointer, pointer, pointer, pointer, pointer, i32,
+                                     pointer, pointer, i64, u64, i64, i64, i32, i32, i32,
+                                     pointer, pointer]
+        library.bsg_walk.restype = None
+        _library = library
+        return library
+
+
+def available() -> bool:
+    """
+    Check whether the native kernel can be used, compiling it if needed.
+    
+    Returns:
+        True if the kernel is loaded
+    """
+    return _load_library() is not None
+
+
+def _address(data, typecode: str):
+    """
+    Get the address of an array's items without copying it when possible.
+    
+    Returns:
+        Address and the object that must stay alive while it is used
+    """
+    if data is None or not len(data):
+        return None, None
+    try:
+        return ctypes.addressof(ctypes.c_char.from_buffer(data)), data
+    except TypeError:
+        # Read-only, such as the arrays of a memory-mapped model
+        if np is not None:
+            view = np.frombuffer(data, dtype=typecode)
+            return view.ctypes.data, view
+        copy = array(typecode, data)
+        return ctypes.addressof(ctypes.c_char.from_buffer(copy)), copy
+
+
+def _get_tables(model: CompiledModel) -> tuple:
+    """Build, once per model, the kernel arguments that describe it."""
+    tables = _tables.get(model)
+    if tables is None:
+        # The kernel walks plain CSR rows; rows moved by patched() are put back
+        source = model.compacted()
+        states, cumulative, _, _ = model.start_table()
+        arrays = [(source.offsets, 'q'), (source.successors, 'i'), (source.targets, 'i'),
+                  (source.cumulative, 'q'), (source.flags, 'B'),
+                  (source.contexts if model.order > 1 else None, 'i'),
+                  (array('i', states), 'i'), (array('q', cumulative), 'q')]
+        addresses, keep = zip(*(_address(data, typecode) for data, typecode in arrays))
+        tables = _tables[model] = (addresses, keep, len(states))
+    return tables
+
+
+def generate_batch(model: CompiledModel, count: int, max_length: int = 100,
+                   min_length: int = 20, seed: int = 0, threads: int = 1) -> List[List[int]]:
+    """
+    Walk many chains in the native kernel, split across threads.
+    
+    Args:
+        model: Compiled model with at least one transition
+        count: Number of chains
+        max_length: Maximum number of words per chain
+        min_length: Minimum number of words before allowing natural endings
+        seed: 64-bit seed; the same seed gives the same chains for any thread count
+        threads: Number of threads to split the chains across
+        
+    Returns:
+        Generated word ids for each chain
+    """
+    global _executor, _executor_size
+    library = _load_library()
+    if library is None:
+        raise RuntimeError("the native sampling kernel is not available")
+    (offsets, successors, targets, cumulative, flags, contexts, starts,
+     start_cumulative), _, num_starts = _get_tables(model)
+    order = model.order
+    width = max(max_length, order)
+    out = array('i', [0]) * (count * width)
+    lengths = array('i', [0]) * count
+    out_address = ctypes.addressof(ctypes.c_char.from_buffer(out)) if count else None
+    lengths_address = ctypes.addressof(ctypes.c_char.from_buffer(lengths)) if count else None
+    seed &= (1 << 64) - 1
+    
+    def walk(first: int, size: int) -> None:
+        library.bsg_walk(offsets, successors, targets, cumulative, flags, contexts, order,
+                         starts, start_cumulative, num_starts, seed, first, size, max_length,
+                         min_length, width, out_address, lengths_address)
+    
+    threads = max(1, min(threads, count))
+    if threads == 1:
+        walk(0, count)
+    else:
+        step = -(-count // threads)
+        # Submit under the lock, so the pool cannot be shut down in between
+        with _lock:
+            if _executor_size < threads:
+                # Grow the shared pool; work already queued on the old one still runs
+                if _executor is not None:
+                    _executor.shutdown(wait=False)
+                _executor = ThreadPoolExecutor(threads, thread_name_prefix='bsg-native')
+                _executor_size = threads
+            futures = [_executor.submit(walk, first, min(step, count - first))
+                       for first in range(0, count, step)]
+        for future in futures:
+            future.result()
+    return [out[i * width:i * width + lengths[i]].tolist() for i in range(count)]
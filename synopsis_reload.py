@@ -0,0 +1,196 @@
+"""
+Hot Model Reload
+
+This module holds the model a server generates from in a ModelHandle. The
+handle points at an immutable snapshot: a compiled BookSynopsisGenerator that
+is never trained again. A new snapshot, loaded from a file or produced by a
+background training job, is prepared off to the side and then swapped in with
+a single reference assignment. Requests that already took the old snapshot
+finish on it; it is freed when the last of them lets go.
+
+The handle also measures how long reloads take and the generation latency of
+requests that overlap a reload, so the cost of a swap can be watched.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional, Sequence
+
+from book_synopsis_generator import BookSynopsisGenerator
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; only its batch tables are skipped
+    np = None
+
+
+def prepare_snapshot(generator: BookSynopsisGenerator) -> None:
+    """
+    Compile a generator and build the tables every request needs.
+    
+    Done before a snapshot takes traffic, or before forking workers, so the
+    first requests do not pay for it and forked workers share the tables.
+    
+    Args:
+        generator: Trained generator
+    """
+    model = generator.compile()
+    if model.num_transitions:
+        model.start_table()
+        if np is not None:
+            model._get_batch_tables()
+
+
+def _percentile(samples: Sequence[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of a sample, or None when it is empty."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ModelHandle:
+    """Atomically swappable reference to the current model snapshot."""
+    
+    def __init__(self, generator: BookSynopsisGenerator, settle_time: float = 1.0,
+                 window: int = 10000):
+        """
+        Initialize the handle.
+        
+        Args:
+            generator: Initial snapshot; it must not be trained further
+            settle_time: Seconds after a swap during which requests still
+                count as overlapping it, to catch the new snapshot warming up
+            window: Number of recent latencies kept for percentiles
+        """
+        self.settle_time = settle_time
+        self.generation = 0
+        prepare_snapshot(generator)
+        self.current = generator
+        self._swap_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Reload windows as (start, end); end is None while a reload is running
+        self._reloads: Deque[List[Optional[float]]] = deque(maxlen=16)
+        self._reload_latencies: Deque[float] = deque(maxlen=window)
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._swap_latencies: Deque[float] = deque(maxlen=window)
+    
+    def swap(self, generator: BookSynopsisGenerator) -> int:
+        """
+        Make a generator the current snapshot.
+        
+        The snapshot is compiled and warmed before the switch, so the swap
+        itself is one reference assignment. A snapshot without a metrics sink
+        keeps reporting to the current one's.
+        
+        Args:
+            generator: New snapshot; it must not be trained further
+            
+        Returns:
+            The new generation number
+        """
+        prepare_snapshot(generator)
+        if generator.metrics is None:
+            generator.metrics = self.current.metrics
+        with self._swap_lock:
+            self.current = generator
+            self.generation += 1
+            return self.generation
+    
+    def reload(self, build: Callable[[], BookSynopsisGenerator]) -> int:
+        """
+        Build a new snapshot and swap it in, timing the whole reload.
+        
+        Args:
+            build: Produces the new, fully trained generator
+            
+        Returns:
+            The new generation number
+        """
+        window: List[Optional[float]] = [time.perf_counter(), None]
+        self._reloads.append(window)
+        try:
+            generation = self.swap(build())
+        finally:
+            window[1] = time.perf_counter()
+        self._reload_latencies.append(window[1] - window[0])
+        return generation
+    
+    def reload_file(self, path: str, mmap: bool = True) -> int:
+        """
+        Swap in a model saved with BookSynopsisGenerator.save.
+        
+        Args:
+            path: Model file
+            mmap: Map the file instead of reading it
+            
+        Returns:
+            The new generation number
+        """
+        return self.reload(lambda: BookSynopsisGenerator.load(path, mmap))
+    
+    def reload_in_background(self, build: Callable[[], BookSynopsisGenerator]) -> Future:
+        """
+        Build a new snapshot on a background thread and swap it in when done.
+        
+        Reloads submitted this way run one at a time, in order. `build` may
+        itself fan out, for example to synopsis_training.train_parallel.
+        
+        Args:
+            build: Produces the new, fully trained generator
+            
+        Returns:
+            Future resolving to the new generation number
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix='model-reload')
+        return self._executor.submit(self.reload, build)
+    
+    def record_latency(self, start: float, end: float) -> None:
+        """
+        Record one generation request.
+        
+        Args:
+            start: time.perf_counter() when the request started
+            end: time.perf_counter() when it finished
+        """
+        latency = end - start
+        self._latencies.append(latency)
+        settle = self.settle_time
+        for reload_start, reload_end in list(self._reloads):
+            if start <= (end if reload_end is None else reload_end + settle) and \
+                    end >= reload_start:
+                self._swap_latencies.append(latency)
+                break
+    
+    def stats(self) -> Dict[str, object]:
+        """
+        Get the reload and latency measurements.
+        
+        Returns:
+            Generation number, reload count and latencies, and p50/p99 of
+            generation latency overall and for requests overlapping a reload,
+            all in seconds
+        """
+        reloads = list(self._reload_latencies)
+        latencies = list(self._latencies)
+        during = list(self._swap_latencies)
+        return {
+            'generation': self.generation,
+            'reloads': len(reloads),
+            'reload_latency_last': reloads[-1] if reloads else None,
+            'reload_latency_max': max(reloads) if reloads else None,
+            'generate_p50': _percentile(latencies, 0.50),
+            'generate_p99': _percentile(latencies, 0.99),
+            'generate_p99_during_reload': _percentile(during, 0.99),
+            'requests_during_reload': len(during),
+        }
+    
+    def close(self) -> None:
+        """Wait for background reloads and release their thread."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
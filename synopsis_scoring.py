@@ -0,0 +1,342 @@
+"""
+Synopsis Scoring
+
+Best-of-N selection scores a batch of generated walks and keeps the top k.
+Every walk gets four components:
+
+    log_likelihood: mean log probability of its transitions under the model
+    repetition: fraction of its transitions that already occurred in it
+    length_miss: how far its length misses the target, relative to the target
+    complete: 1 if its last word ends a sentence, else 0
+
+and its score is the weighted sum of the components (DEFAULT_WEIGHTS). With
+NumPy the whole batch is scored at once: the walks are laid out as one padded
+matrix, and every transition's probability is found with a single
+searchsorted over per-model keys built on first use. Walks from
+CompiledModel.walk_batch come with the position of every transition they
+drew, so best_walks skips even that lookup and scoring costs a small
+fraction of generating them. Without NumPy the walks are scored one at a
+time.
+"""
+
+import math
+import weakref
+from itertools import chain
+from typing import Dict, List, Mapping, Optional, Sequence
+
+from synopsis_model import ENDS_SENTENCE, CompiledModel
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; walks are then scored one at a time
+    np = None
+
+# Weight of each component in the score; penalties have negative weights
+DEFAULT_WEIGHTS = {'log_likelihood': 1.0, 'repetition': -1.0, 'length_miss': -1.0,
+                   'complete': 1.0}
+
+# Log probability given to a transition the model does not contain, and to
+# walks without any transitions
+UNSEEN_LOG_PROB = math.log(1e-6)
+
+# Lookup tables of each model, dropped with the model
+_tables: 'weakref.WeakKeyDictionary[CompiledModel, tuple]' = weakref.WeakKeyDictionary()
+_python_tables: 'weakref.WeakKeyDictionary[CompiledModel, tuple]' = weakref.WeakKeyDictionary()
+
+
+def _get_tables(model: CompiledModel) -> tuple:
+    """
+    Build, once per model, the log probability of every transition and the
+    sorted keys that find a transition from its state and word.
+    
+    Transitions are numbered by their position in the rows of compacted(),
+    as walk_batch reports them. A transition's key is state * vocabulary
+    size + word. For higher orders, contexts are keyed the same way in base
+    vocabulary size, when that fits in 64 bits, so the state before every
+    word can be looked up at once.
+    """
+    tables = _tables.get(model)
+    if tables is not None:
+        return tables
+    # Plain CSR rows; rows moved by patched() are put back, state numbers are kept
+    source = model.compacted()
+    width = len(model.vocab)
+    order = model.order
+    offsets = np.asarray(source.offsets, dtype=np.int64)
+    sizes = np.diff(offsets)
+    nonempty = sizes > 0
+    cumulative = np.asarray(source.cumulative, dtype=np.int64)
+    counts = cumulative.copy()
+    counts[1:] -= cumulative[:-1]
+    counts[offsets[:-1][nonempty]] = cumulative[offsets[:-1][nonempty]]
+    totals = np.repeat(cumulative[offsets[1:][nonempty] - 1], sizes[nonempty])
+    log_probs = np.log(counts / totals)
+    
+    states = np.repeat(np.arange(len(sizes), dtype=np.int64), sizes)
+    keys = states * width + np.asarray(source.successors, dtype=np.int64)
+    key_positions = np.argsort(keys)
+    keys = keys[key_positions]
+    
+    context_keys = context_states = powers = None
+    if order > 1 and width ** order < 1 << 63:
+        powers = width ** np.arange(order - 1, -1, -1, dtype=np.int64)
+        context_keys = np.asarray(model.contexts, dtype=np.int64).reshape(-1, order) @ powers
+        context_states = np.argsort(context_keys)
+        context_keys = context_keys[context_states]
+    is_ender = (np.frombuffer(model.flags, dtype=np.uint8) & ENDS_SENTENCE) != 0
+    tables = _tables[model] = (log_probs, keys, key_positions, context_keys, context_states,
+                               powers, is_ender)
+    return tables
+
+
+def score_components(model: CompiledModel, chains: Sequence[Sequence[int]],
+                     min_length: int = 20,
+                     target_length: Optional[int] = None) -> Dict[str, Sequence[float]]:
+    """
+    Compute the score components of a batch of walks.
+    
+    Args:
+        model: Model the walks were generated from
+        chains: Generated word ids of each walk, starting with its context
+        min_length: Minimum number of words the walks were asked for; without
+            a target_length, only walks that stop at or before it miss
+        target_length: Number of words to aim for, or None
+        
+    Returns:
+        Mapping of component name to one value per walk
+    """
+    if np is None or model.order > 1 and _get_tables(model)[3] is None:
+        return _score_components_python(model, chains, min_length, target_length)
+    _, keys, key_positions, context_keys, context_states, powers, _ = _get_tables(model)
+    order = model.order
+    count = len(chains)
+    lengths = np.fromiter(map(len, chains), dtype=np.int64, count=count)
+    width = max(int(lengths.max(initial=0)), order + 1)
+    
+    # Pad the walks into one matrix
+    matrix = np.zeros((count, width), dtype=np.int64)
+    rows = np.repeat(np.arange(count), lengths)
+    columns = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    matrix[rows, columns] = np.fromiter(chain.from_iterable(chains), dtype=np.int64,
+                                        count=len(rows))
+    valid = np.arange(order, width) < lengths[:, None]
+    
+    # State before every word: the previous word itself, or its context's row
+    if order == 1:
+        states = matrix[:, :-1]
+        known = valid.copy()
+    else:
+        windows = np.lib.stride_tricks.sliding_window_view(matrix, order, axis=1)[:, :-1]
+        context = windows @ powers
+        found = np.minimum(np.searchsorted(context_keys, context), len(context_keys) - 1)
+        known = valid & (context_keys[found] == context)
+        states = context_states[found]
+    
+    transitions = states * len(model.vocab) + matrix[:, order:]
+    found = np.minimum(np.searchsorted(keys, transitions), len(keys) - 1)
+    known &= keys[found] == transitions
+    positions = np.where(known, key_positions[found], -1)
+    return _components(model, matrix, positions, lengths, min_length, target_length)
+
+
+def score_walks(model: CompiledModel, chains: 'np.ndarray', positions: 'np.ndarray',
+                lengths: 'np.ndarray', min_length: int = 20,
+                target_length: Optional[int] = None) -> Dict[str, 'np.ndarray']:
+    """
+    Compute the score components of walks from CompiledModel.walk_batch.
+    
+    The transitions are already known, so nothing is looked up: this is the
+    fast path for best-of-N over a lockstep batch.
+    
+    Args:
+        model: Model the walks were generated from
+        chains: Padded word ids of each walk
+        positions: Position of each drawn transition, -1 past the end
+        lengths: Length of each walk
+        min_length: Minimum number of words the walks were asked for
+        target_length: Number of words to aim for, or None
+        
+    Returns:
+        Mapping of component name to one value per walk
+    """
+    return _components(model, chains, positions, lengths, min_length, target_length)
+
+
+def _components(model: CompiledModel, chains: 'np.ndarray', positions: 'np.ndarray',
+                lengths: 'np.ndarray', min_length: int,
+                target_length: Optional[int]) -> Dict[str, 'np.ndarray']:
+    """Compute the score components from padded walks and their transition positions."""
+    log_probs, _, _, _, _, _, is_ender = _get_tables(model)
+    count = len(lengths)
+    steps = np.maximum(lengths - model.order, 0)
+    known = positions >= 0
+    step_log_probs = np.where(known, log_probs[positions], UNSEEN_LOG_PROB)
+    valid = np.arange(positions.shape[1]) < steps[:, None]
+    total = np.where(valid, step_log_probs, 0.0).sum(axis=1)
+    log_likelihood = np.where(steps > 0, total / np.maximum(steps, 1), UNSEEN_LOG_PROB)
+    
+    # Count transitions equal to an earlier one; unknown ones get distinct negative keys
+    keyed = np.where(known, positions, -1 - np.arange(positions.shape[1]))
+    keyed.sort(axis=1)
+    repeats = (keyed[:, 1:] == keyed[:, :-1]).sum(axis=1)
+    repetition = repeats / np.maximum(steps, 1)
+    
+    last = chains[np.arange(count), np.maximum(lengths - 1, 0)]
+    complete = ((steps > 0) & is_ender[last]).astype(np.float64)
+    if target_length is not None:
+        length_miss = abs(lengths - target_length) / max(target_length, 1)
+    else:
+        length_miss = np.maximum(min_length + 1 - lengths, 0) / max(min_length + 1, 1)
+    return {'log_likelihood': log_likelihood, 'repetition': repetition,
+            'length_miss': length_miss, 'complete': complete}
+
+
+def _get_python_tables(model: CompiledModel) -> tuple:
+    """Get, once per model, its CSR rows and, for higher orders, the state of each context."""
+    tables = _python_tables.get(model)
+    if tables is None:
+        contexts = None
+        if model.order > 1:
+            contexts = {tuple(model.state_words(state)): state
+                        for state in range(model.num_states)}
+        tables = _python_tables[model] = (model.compacted(), contexts)
+    return tables
+
+
+def _score_components_python(model: CompiledModel, chains: Sequence[Sequence[int]],
+                             min_length: int,
+                             target_length: Optional[int]) -> Dict[str, List[float]]:
+    """Compute the score components one walk at a time, without NumPy."""
+    source, contexts = _get_python_tables(model)
+    order = model.order
+    successors = source.successors
+    cumulative = source.cumulative
+    flags = model.flags
+    components = {'log_likelihood': [], 'repetition': [], 'length_miss': [], 'complete': []}
+    for ids in chains:
+        steps = max(len(ids) - order, 0)
+        total = 0.0
+        seen = set()
+        repeats = 0
+        for i in range(order, len(ids)):
+            word = ids[i]
+            # State before the word, from its context as in the NumPy path
+            state = ids[i - 1] if order == 1 else contexts.get(tuple(ids[i - order:i]))
+            position = None
+            if state is not None and state < source.num_states:
+                lo, hi = source.row(state)
+                for candidate in range(lo, hi):
+                    if successors[candidate] == word:
+                        position = candidate
+                        break
+            if position is None:
+                total += UNSEEN_LOG_PROB
+            else:
+                repeats += position in seen
+                seen.add(position)
+                count = cumulative[position] - (cumulative[position - 1] if position > lo else 0)
+                total += math.log(count / cumulative[hi - 1])
+        
+        length = len(ids)
+        if target_length is not None:
+            miss = abs(length - target_length) / max(target_length, 1)
+        else:
+            miss = max(min_length + 1 - length, 0) / max(min_length + 1, 1)
+        components['log_likelihood'].append(total / steps if steps else UNSEEN_LOG_PROB)
+        components['repetition'].append(repeats / steps if steps else 0.0)
+        components['length_miss'].append(miss)
+        components['complete'].append(float(steps > 0 and bool(flags[ids[-1]] & ENDS_SENTENCE)))
+    return components
+
+
+def score_chains(model: CompiledModel, chains: Sequence[Sequence[int]], min_length: int = 20,
+                 target_length: Optional[int] = None,
+                 weights: Optional[Mapping[str, float]] = None) -> List[float]:
+    """
+    Score a batch of walks; higher is better.
+    
+    Args:
+        model: Model the walks were generated from
+        chains: Generated word ids of each walk, starting with its context
+        min_length: Minimum number of words the walks were asked for
+        target_length: Number of words to aim for, or None
+        weights: Weight of each component; components left out keep their
+            DEFAULT_WEIGHTS weight
+            
+    Returns:
+        Score of each walk
+    """
+    if not len(chains):
+        return []
+    return _combine(score_components(model, chains, min_length, target_length), weights,
+                    len(chains))
+
+
+def _combine(components: Mapping[str, Sequence[float]], weights: Optional[Mapping[str, float]],
+             count: int) -> List[float]:
+    """Weigh and add up the components of each walk."""
+    weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+    if np is None:
+        return [sum(weights[name] * values[i] for name, values in components.items())
+                for i in range(count)]
+    scores = sum(weights[name] * np.asarray(values, dtype=np.float64)
+                 for name, values in components.items())
+    return scores.tolist()
+
+
+def best_walks(model: CompiledModel, k: int = 1, candidates: int = 64, max_length: int = 100,
+               min_length: int = 20, rng=None, target_length: Optional[int] = None,
+               weights: Optional[Mapping[str, float]] = None) -> List[List[int]]:
+    """
+    Walk a batch of candidates as generate_batch does and keep the best k.
+    
+    Args:
+        model: Model with at least one transition
+        k: Number of walks to keep
+        candidates: Number of walks to generate
+        max_length: Maximum number of words per walk
+        min_length: Minimum number of words before allowing natural endings
+        rng: NumPy Generator (a random.Random without NumPy), as for
+            generate_batch
+        target_length: Number of words to aim for, or None
+        weights: Weight of each score component
+        
+    Returns:
+        Word ids of the kept walks, best first
+    """
+    if np is None:
+        chains = model.generate_batch(candidates, max_length, min_length, rng)
+        scores = score_chains(model, chains, min_length, target_length, weights)
+        return [chains[i] for i in top_k(scores, k)]
+    chains, positions, lengths = model.walk_batch(candidates, max_length, min_length, rng)
+    components = score_walks(model, chains, positions, lengths, min_length, target_length)
+    best = top_k(_combine(components, weights, candidates), k)
+    return [chains[i, :lengths[i]].tolist() for i in best]
+
+
+def top_k(scores: Sequence[float], k: int) -> List[int]:
+    """
+    Find the best-scoring items.
+    
+    Args:
+        scores: Score of each item
+        k: Number of items to keep
+        
+    Returns:
+        Indices of the k highest scores, best first; ties keep their order
+        and NaN scores rank as -inf
+    """
+    k = max(0, min(k, len(scores)))
+    if np is None or not k:
+        return sorted(range(len(scores)),
+                      key=lambda i: -scores[i] if scores[i] == scores[i] else math.inf)[:k]
+    values = np.asarray(scores, dtype=np.float64)
+    values = np.where(np.isnan(values), -np.inf, values)
+    if k < len(values):
+        # Everything scoring at least the k-th best, then sorted stably
+        threshold = np.partition(values, len(values) - k)[len(values) - k]
+        candidates = np.flatnonzero(values >= threshold)
+    else:
+        candidates = np.arange(len(values))
+    ranked = candidates[np.argsort(-values[candidates], kind='stable')]
+    return ranked[:k].tolist()
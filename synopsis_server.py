@@ -0,0 +1,743 @@
+#!/usr/bin/env python3
+"""
+Synopsis Generation Server
+
+This module serves a trained BookSynopsisGenerator over HTTP with asyncio.
+Requests to /generate are queued and coalesced into micro-batches: the batch
+loop waits at most `max_batch_delay` seconds after the first request of a batch
+for others to arrive, then generates all of their chains together over the
+shared, read-only compiled model. A bounded queue sheds load with 503 once
+`queue_depth` requests are waiting.
+
+GET /stats reports the model generation, reload latency and generation
+latency percentiles, and POST /reload swaps the model file in again without
+dropping requests (see synopsis_reload). GET /metrics renders the model's
+metrics sink in the Prometheus text format when it is a PrometheusSink (see
+synopsis_metrics). GET /stream sends a single synopsis in chunks as its words
+are drawn, without batching. With best_of, /generate scores count * best_of
+candidates and returns the best count of them (see synopsis_scoring).
+
+serve_prefork runs the same server in several forked worker processes that
+share one memory-mapped copy of the model.
+
+Only the standard library is needed; NumPy makes the batches lockstep.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import tempfile
+import time
+import traceback
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlsplit
+
+import synopsis_scoring
+from book_synopsis_generator import BookSynopsisGenerator, batch_rng
+from synopsis_metrics import PrometheusSink
+from synopsis_reload import ModelHandle
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+_MAX_HEADER_BYTES = 16 << 10
+_MAX_BODY_BYTES = 64 << 10
+
+
+def _integer(value) -> int:
+    """
+    Read an integer request parameter.
+    
+    Args:
+        value: Query string text, or a value from a JSON body
+        
+    Returns:
+        The integer
+        
+    Raises:
+        ValueError: If the value is not an integer; floats count only when
+            they are integral, and booleans never do
+        TypeError: If the value is not a string or a number
+    """
+    if isinstance(value, bool):
+        raise TypeError("booleans are not integers")
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"{value} is not an integer")
+    return int(value)
+
+
+class _Pending:
+    """A queued generation request waiting for its batch."""
+    
+    __slots__ = ('max_length', 'min_length', 'count', 'seed', 'best_of', 'future')
+    
+    def __init__(self, max_length: int, min_length: int, count: int, seed: Optional[int],
+                 best_of: int, future: asyncio.Future):
+        self.max_length = max_length
+        self.min_length = min_length
+        self.count = count
+        self.seed = seed
+        self.best_of = best_of
+        self.future = future
+
+
+class SynopsisBatcher:
+    """Coalesces concurrent generation requests into batches over one model."""
+    
+    def __init__(self, model: Union[BookSynopsisGenerator, ModelHandle],
+                 max_batch_delay: float = 0.002, max_batch_size: int = 256,
+                 queue_depth: int = 1024):
+        """
+        Initialize the batcher.
+        
+        Args:
+            model: Trained generator, or a handle whose current snapshot is
+                used; either way the model is only read
+            max_batch_delay: Seconds to wait for more requests after the first
+                one of a batch arrives
+            max_batch_size: Number of chains after which a batch is started
+                without waiting out the delay
+            queue_depth: Maximum number of requests waiting for a batch
+        """
+        self.handle = model if isinstance(model, ModelHandle) else ModelHandle(model)
+        self.max_batch_delay = max_batch_delay
+        self.max_batch_size = max_batch_size
+        self.queue_depth = queue_depth
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start the batch loop on the running event loop."""
+        self._queue = asyncio.Queue(self.queue_depth)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop the batch loop, failing any requests still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._queue is not None and not self._queue.empty():
+            pending = self._queue.get_nowait()
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError("server is shutting down"))
+    
+    async def submit(self, max_length: int = 100, min_length: int = 20, count: int = 1,
+                     seed: Optional[int] = None, best_of: int = 1) -> List[str]:
+        """
+        Queue a request and wait for its synopses.
+        
+        Requests with a seed are generated from their own random stream, so
+        the same seed always gives the same synopses regardless of batching.
+        
+        Args:
+            max_length: Maximum length for each synopsis
+            min_length: Minimum number of words before allowing natural endings
+            count: Number of synopses
+            seed: Seed for reproducible output, or None
+            best_of: Candidates generated per synopsis; the best-scoring
+                count of them are returned (see synopsis_scoring)
+            
+        Returns:
+            Generated synopses
+            
+        Raises:
+            asyncio.QueueFull: If queue_depth requests are already waiting
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Pending(max_length, min_length, count, seed, best_of, future))
+        return await future
+    
+    async def _run(self) -> None:
+        """Collect requests into batches and generate them."""
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            chains = batch[0].count * batch[0].best_of
+            deadline = loop.time() + self.max_batch_delay
+            while chains < self.max_batch_size:
+                if queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        pending = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    pending = queue.get_nowait()
+                batch.append(pending)
+                chains += pending.count * pending.best_of
+            self._generate(batch)
+    
+    def _generate(self, batch: List[_Pending]) -> None:
+        """
+        Generate the synopses for one batch and resolve its futures.
+        
+        Unseeded requests with the same length limits share a single
+        generate_batch call; seeded requests get one call each, and so do
+        best-of requests, each already a batch of count * best_of chains. The
+        whole batch runs on the snapshot that was current when it started.
+        """
+        snapshot = self.handle.current
+        model = snapshot.compile()
+        groups: Dict[Tuple[int, int], List[_Pending]] = {}
+        for pending in batch:
+            if pending.future.done():
+                continue  # The client went away
+            try:
+                if not model.num_transitions:
+                    pending.future.set_result(["No training data available."] * pending.count)
+                elif pending.best_of > 1:
+                    self._resolve_best(snapshot, pending, batch_rng(
+                        snapshot.rng if pending.seed is None else pending.seed))
+                elif pending.seed is not None:
+                    self._resolve(snapshot, [pending], pending.count, batch_rng(pending.seed))
+                else:
+                    groups.setdefault((pending.max_length, pending.min_length),
+                                      []).append(pending)
+            except Exception as error:
+                # A failing request must never stop the batch loop
+                self._fail([pending], error)
+        for group in groups.values():
+            try:
+                self._resolve(snapshot, group, sum(pending.count for pending in group),
+                              batch_rng(snapshot.rng))
+            except Exception as error:
+                self._fail(group, error)
+    
+    @staticmethod
+    def _fail(group: List[_Pending], error: Exception) -> None:
+        """Hand an error to every request of a group that is still waiting."""
+        for pending in group:
+            if not pending.future.done():
+                pending.future.set_exception(error)
+    
+    def _resolve(self, snapshot: BookSynopsisGenerator, group: List[_Pending], count: int,
+                 rng) -> None:
+        """Generate `count` chains for requests sharing length limits and hand them out."""
+        model = snapshot.compile()
+        first = group[0]
+        try:
+            chains = model.generate_batch(count, first.max_length, first.min_length, rng)
+        except Exception as error:
+            for pending in group:
+                pending.future.set_exception(error)
+            return
+        finish = snapshot._finish
+        start = 0
+        for pending in group:
+            end = start + pending.count
+            pending.future.set_result([finish(model, ids, first.max_length, first.min_length)
+                                       for ids in chains[start:end]])
+            start = end
+
+    @staticmethod
+    def _resolve_best(snapshot: BookSynopsisGenerator, pending: _Pending, rng) -> None:
+        """Generate count * best_of chains for one request and hand out the best."""
+        model = snapshot.compile()
+        try:
+            chains = synopsis_scoring.best_walks(model, pending.count,
+                                                 pending.count * pending.best_of,
+                                                 pending.max_length, pending.min_length, rng)
+        except Exception as error:
+            pending.future.set_exception(error)
+            return
+        pending.future.set_result([snapshot._finish(model, ids, pending.max_length,
+                                                    pending.min_length) for ids in chains])
+
+
+class SynopsisServer:
+    """Minimal HTTP/1.1 front end for a SynopsisBatcher."""
+    
+    def __init__(self, batcher: SynopsisBatcher, max_count: int = 100, max_length: int = 1000,
+                 model_path: Optional[str] = None, max_best_of: int = 64):
+        """
+        Initialize the server.
+        
+        Args:
+            batcher: Batcher that generates the synopses
+            max_count: Largest `count` a single request may ask for
+            max_length: Largest `max_length` a single request may ask for
+            model_path: Model file that POST /reload swaps in again; without
+                one the endpoint is disabled
+            max_best_of: Largest `best_of` a single request may ask for
+        """
+        self.batcher = batcher
+        self.model_path = model_path
+        self.max_count = max_count
+        self.max_length = max_length
+        self.max_best_of = max_best_of
+        self.requests_served = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        # Open connections, mapped to whether they are in the middle of a request
+        self._connections: Dict[asyncio.StreamWriter, bool] = {}
+        self._draining = False
+    
+    async def start(self, host: str = '127.0.0.1', port: int = 8000,
+                    sock=None) -> asyncio.AbstractServer:
+        """
+        Start the batch loop and begin accepting connections.
+        
+        Args:
+            host: Address to listen on
+            port: Port to listen on
+            sock: Already-bound listening socket to use instead of host and port
+            
+        Returns:
+            The asyncio server
+        """
+        self.batcher.start()
+        if sock is not None:
+            self._server = await asyncio.start_server(self._handle, sock=sock)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+    
+    async def drain(self, timeout: float = 30.0) -> None:
+        """
+        Stop accepting connections and let in-flight requests finish.
+        
+        Idle keep-alive connections are closed at once; busy ones, including
+        connections still waiting for their first request, are closed after
+        their current response. The batch loop is stopped once every
+        connection is gone or `timeout` seconds have passed.
+        
+        Args:
+            timeout: Seconds to wait for in-flight requests
+        """
+        self._draining = True
+        if self._server is not None:
+            self._server.close()
+        for writer, busy in list(self._connections.items()):
+            if not busy:
+                writer.close()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._connections and loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        await self.batcher.stop()
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve the requests of one keep-alive connection."""
+        connections = self._connections
+        # A new connection counts as busy until its first request is answered
+        connections[writer] = True
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 413, {'error': "request header too large"}, False)
+                    break
+                connections[writer] = True
+                if len(head) > _MAX_HEADER_BYTES:
+                    await self._respond(writer, 413, {'error': "request header too large"}, False)
+                    break
+                
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ')
+                except ValueError:
+                    await self._respond(writer, 400, {'error': "malformed request line"}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' else \
+                    connection == 'keep-alive'
+                
+                body = b''
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, 400, {'error': "bad Content-Length"}, False)
+                    break
+                if length > _MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {'error': "request body too large"}, False)
+                    break
+                if length:
+                    body = await reader.readexactly(length)
+                
+                status, payload = await self._dispatch(method, target, body)
+                self.requests_served += 1
+                keep_alive = keep_alive and not self._draining
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+                connections[writer] = False
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            connections.pop(writer, None)
+            writer.close()
+    
+    async def _dispatch(self, method: str, target: str,
+                        body: bytes) -> Tuple[int, Union[dict, str, AsyncIterator[str]]]:
+        """
+        Route one request.
+        
+        Returns:
+            HTTP status and JSON payload, a string for plain text, or an
+            async iterator of text to stream
+        """
+        url = urlsplit(target)
+        handle = self.batcher.handle
+        if url.path == '/stats':
+            return 200, dict(handle.stats(), requests_served=self.requests_served)
+        if url.path == '/metrics':
+            metrics = handle.current.metrics
+            if not isinstance(metrics, PrometheusSink):
+                return 404, {'error': "metrics are not enabled"}
+            return 200, metrics.exposition()
+        if url.path == '/reload':
+            if method != 'POST':
+                return 405, {'error': "use POST"}
+            if self.model_path is None:
+                return 404, {'error': "reloading is not enabled"}
+            try:
+                generation = await asyncio.get_running_loop().run_in_executor(
+                    None, handle.reload_file, self.model_path)
+            except (OSError, ValueError) as error:
+                return 500, {'error': f"reload failed: {error}"}
+            return 200, {'generation': generation}
+        if url.path not in ('/generate', '/stream'):
+            return 404, {'error': f"no such endpoint: {url.path}"}
+        if method not in ('GET', 'POST'):
+            return 405, {'error': "use GET or POST"}
+        
+        params = dict(parse_qsl(url.query))
+        if body:
+            try:
+                fields = json.loads(body)
+            except ValueError:
+                fields = None
+            if not isinstance(fields, dict):
+                return 400, {'error': "body must be a JSON object"}
+            params.update(fields)
+        try:
+            max_length = _integer(params.get('max_length', 100))
+            min_length = _integer(params.get('min_length', 20))
+            count = _integer(params.get('count', 1))
+            seed = params.get('seed')
+            seed = None if seed is None else _integer(seed)
+            best_of = _integer(params.get('best_of', 1))
+        except (ValueError, TypeError, OverflowError):
+            return 400, {'error': "max_length, min_length, count, seed and best_of "
+                                  "must be integers"}
+        if seed is not None and not 0 <= seed < 1 << 64:
+            return 400, {'error': "seed must be between 0 and 2**64 - 1"}
+        if not 1 <= max_length <= self.max_length:
+            return 400, {'error': f"max_length must be between 1 and {self.max_length}"}
+        if not 1 <= count <= self.max_count:
+            return 400, {'error': f"count must be between 1 and {self.max_count}"}
+        if not 1 <= best_of <= self.max_best_of:
+            return 400, {'error': f"best_of must be between 1 and {self.max_best_of}"}
+        if url.path == '/stream':
+            return 200, handle.current.aiter_synopsis(max_length, min_length, seed)
+        
+        start = time.perf_counter()
+        try:
+            synopses = await self.batcher.submit(max_length, min_length, count, seed, best_of)
+        except asyncio.QueueFull:
+            return 503, {'error': "too many queued requests"}
+        handle.record_latency(start, time.perf_counter())
+        return 200, {'synopses': synopses}
+    
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int,
+                       payload: Union[dict, str, AsyncIterator[str]], keep_alive: bool) -> None:
+        """
+        Write a JSON response, a plain text one for a string payload, or a
+        chunked one with a chunk per item of an async iterator.
+        """
+        connection = f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        if hasattr(payload, '__aiter__'):
+            writer.write((f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                          f"Content-Type: text/plain; charset=utf-8\r\n"
+                          f"Transfer-Encoding: chunked\r\n" + connection).encode())
+            async for piece in payload:
+                data = piece.encode()
+                writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+                await writer.drain()
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+            return
+        if isinstance(payload, str):
+            body = payload.encode()
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            body = json.dumps(payload).encode()
+            content_type = 'application/json'
+        head = (f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n" + connection)
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+
+def load_generator(model: Optional[str] = None, train: Optional[List[str]] = None,
+                   order: int = 1) -> BookSynopsisGenerator:
+    """
+    Load a saved model or train one from text files.
+    
+    Args:
+        model: Path of a model written by BookSynopsisGenerator.save
+        train: Training files to use when no model path is given
+        order: Number of words of context when training
+        
+    Returns:
+        Generator ready to serve
+    """
+    if model is not None:
+        return BookSynopsisGenerator.load(model)
+    generator = BookSynopsisGenerator(order)
+    for path in train or []:
+        generator.load_training_file(path)
+    return generator
+
+
+async def serve(model: Union[BookSynopsisGenerator, ModelHandle], host: str = '127.0.0.1',
+                port: int = 8000, max_batch_delay: float = 0.002, max_batch_size: int = 256,
+                queue_depth: int = 1024, model_path: Optional[str] = None) -> None:
+    """
+    Serve a generator until cancelled.
+    
+    Args:
+        model: Trained generator, or a handle that can be swapped while serving
+        host: Address to listen on
+        port: Port to listen on
+        max_batch_delay: Seconds to wait for more requests to join a batch
+        max_batch_size: Number of chains that starts a batch immediately
+        queue_depth: Maximum number of requests waiting for a batch
+        model_path: Model file that POST /reload swaps in again
+    """
+    batcher = SynopsisBatcher(model, max_batch_delay, max_batch_size, queue_depth)
+    server = await SynopsisServer(batcher, model_path=model_path).start(host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+def _share_model(generator: BookSynopsisGenerator) -> BookSynopsisGenerator:
+    """
+    Put a generator's compiled model in a file mapping that forked workers share.
+    
+    A model that was trained in this process lives in private heap memory,
+    where reference counting would gradually copy it into every worker. It
+    is written to a temporary file and mapped back instead; the file is
+    unlinked at once and the mapping keeps it alive.
+    """
+    if generator._compiled is not None and generator._compiled._buffer is not None:
+        return generator  # Already memory-mapped from a model file
+    directory = tempfile.mkdtemp(prefix='synopsis-')
+    path = os.path.join(directory, 'model.bsg')
+    try:
+        generator.save(path)
+        shared = BookSynopsisGenerator.load(path)
+        shared.metrics = generator.metrics
+        return shared
+    finally:
+        os.unlink(path)
+        os.rmdir(directory)
+
+
+def _run_worker(sock: socket.socket, handle: ModelHandle, batch_options: dict,
+                max_requests: int, max_lifetime: float, graceful_timeout: float) -> None:
+    """
+    Serve from a forked worker until told to stop or due for recycling.
+    
+    The worker stops accepting connections on SIGTERM, after `max_requests`
+    requests or after `max_lifetime` seconds, finishes the requests it has
+    in flight and returns.
+    """
+    async def run():
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        batcher = SynopsisBatcher(handle, **batch_options)
+        server = SynopsisServer(batcher)
+        await server.start(sock=sock)
+        
+        deadline = loop.time() + max_lifetime if max_lifetime else None
+        while not stop.is_set():
+            if max_requests and server.requests_served >= max_requests:
+                break
+            if deadline is not None and loop.time() >= deadline:
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), 0.25)
+            except asyncio.TimeoutError:
+                pass
+        await server.drain(graceful_timeout)
+    
+    asyncio.run(run())
+
+
+def serve_prefork(generator: BookSynopsisGenerator, host: str = '127.0.0.1', port: int = 8000,
+                  workers: int = 0, max_requests: int = 0, max_requests_jitter: int = 0,
+                  max_lifetime: float = 0.0, graceful_timeout: float = 30.0,
+                  model_path: Optional[str] = None, **batch_options) -> None:
+    """
+    Serve a generator from several forked worker processes.
+    
+    The parent binds the listening socket, maps the compiled model from a
+    file and builds its sampling tables once, then forks the workers, which
+    share those pages instead of each holding a copy. Each worker runs its
+    own event loop and batcher on the shared socket.
+    
+    Workers are recycled gracefully: once one has served `max_requests`
+    requests (plus a random 0..`max_requests_jitter`, so workers do not all
+    restart together) or lived `max_lifetime` seconds, it stops accepting,
+    finishes its in-flight requests and exits, and the parent forks a
+    replacement. SIGHUP first reloads `model_path`, if given, in the parent
+    and then recycles every worker, starting each replacement before
+    retiring the old worker, so in-flight requests finish on the old model.
+    SIGTERM or SIGINT drains all workers and returns. POSIX only.
+    
+    Args:
+        generator: Trained generator
+        host: Address to listen on
+        port: Port to listen on
+        workers: Number of worker processes (defaults to the CPU count)
+        max_requests: Requests after which a worker is recycled; 0 disables
+        max_requests_jitter: Largest random addition to max_requests
+        max_lifetime: Seconds after which a worker is recycled; 0 disables
+        graceful_timeout: Seconds a stopping worker may spend on in-flight requests
+        model_path: Model file that SIGHUP swaps in again
+        **batch_options: max_batch_delay, max_batch_size and queue_depth for
+            each worker's SynopsisBatcher
+    """
+    workers = workers or os.cpu_count() or 1
+    # Workers inherit the handle, and with it the generation and reload times
+    handle = ModelHandle(_share_model(generator))
+    sock = socket.create_server((host, port), backlog=1024)
+    sock.setblocking(False)
+    
+    signals = {signal.SIGCHLD, signal.SIGTERM, signal.SIGINT, signal.SIGHUP}
+    signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+    children: Dict[int, bool] = {}  # pid -> replace when it exits
+    
+    def spawn() -> None:
+        pid = os.fork()
+        if pid:
+            children[pid] = True
+            return
+        # Worker: take the default signal handling back and leave Ctrl-C to the parent
+        status = 0
+        try:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, signals)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            # Forked workers would otherwise share one random stream
+            random.seed()
+            limit = max_requests + random.randint(0, max_requests_jitter) if max_requests else 0
+            _run_worker(sock, handle, batch_options, limit, max_lifetime, graceful_timeout)
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+    
+    def retire(pid: int, replace: bool) -> None:
+        children[pid] = replace
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    
+    try:
+        for _ in range(workers):
+            spawn()
+        stopping = False
+        while children:
+            signo = signal.sigtimedwait(signals, 1.0)
+            if signo is not None and signo.si_signo in (signal.SIGTERM, signal.SIGINT):
+                if not stopping:
+                    stopping = True
+                    for pid in list(children):
+                        retire(pid, False)
+            elif signo is not None and signo.si_signo == signal.SIGHUP and not stopping:
+                if model_path is not None:
+                    try:
+                        handle.reload_file(model_path)
+                    except (OSError, ValueError):
+                        traceback.print_exc()
+                for pid in [pid for pid, replace in children.items() if replace]:
+                    spawn()
+                    retire(pid, False)
+            
+            # Reap every worker that has exited and replace it unless shutting down
+            while children:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+                if not pid:
+                    break
+                if children.pop(pid, False) and not stopping:
+                    spawn()
+    finally:
+        sock.close()
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, signals)
+
+
+def main():
+    """Parse the command line and run the server."""
+    parser = argparse.ArgumentParser(description="Serve book synopses over HTTP.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--model', help="model file written by BookSynopsisGenerator.save")
+    source.add_argument('--train', nargs='+', help="text files to train on at startup")
+    parser.add_argument('--order', type=int, default=1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-delay', type=float, default=0.002,
+                        help="seconds to wait for requests to join a batch")
+    parser.add_argument('--max-batch-size', type=int, default=256,
+                        help="chains that start a batch without waiting")
+    parser.add_argument('--queue-depth', type=int, default=1024,
+                        help="queued requests before answering 503")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="pre-forked worker processes sharing the model (0 = CPU count)")
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help="recycle a worker after this many requests (0 = never)")
+    parser.add_argument('--max-requests-jitter', type=int, default=0)
+    parser.add_argument('--max-lifetime', type=float, default=0.0,
+                        help="recycle a worker after this many seconds (0 = never)")
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help="seconds a stopping worker may spend on in-flight requests")
+    parser.add_argument('--metrics', action='store_true',
+                        help="record metrics and serve them at /metrics (per worker)")
+    args = parser.parse_args()
+    
+    generator = load_generator(args.model, args.train, args.order)
+    if args.metrics:
+        generator.metrics = PrometheusSink()
+    print(f"Serving on http://{args.host}:{args.port}/generate")
+    if args.workers != 1:
+        serve_prefork(generator, args.host, args.port, args.workers, args.max_requests,
+                      args.max_requests_jitter, args.max_lifetime, args.graceful_timeout,
+                      args.model, max_batch_delay=args.max_batch_delay,
+                      max_batch_size=args.max_batch_size, queue_depth=args.queue_depth)
+        return
+    try:
+        asyncio.run(serve(generator, args.host, args.port, args.max_batch_delay,
+                          args.max_batch_size, args.queue_depth, args.model))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Parallel Corpus Training
+
+This module trains a BookSynopsisGenerator on several processes at once.
+Each training file is cut into byte ranges at whitespace, every range is
+counted by a separate worker, and the partial transition and sentence starter
+tables are merged back in corpus order. The transitions and starters that
+cross a range boundary are stitched back in, so the merged model is identical to
+a serial run of load_training_file over the same files.
+"""
+
+import codecs
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from book_synopsis_generator import (_ASCII_COMPATIBLE, BookSynopsisGenerator, Tokenizer,
+                                     iter_word_runs)
+from synopsis_model import CAPITALIZED, ENDS_SENTENCE, pack_context, unpack_context
+
+# Result of one shard: (words in first-seen order, transitions and sentence
+# starters keyed by packed contexts of those word positions, first order + 1
+# words, last order + 1 words, number of words)
+ShardResult = Tuple[List[str], Dict[int, Dict[int, int]], Dict[int, int], List[str], List[str], int]
+
+_WHITESPACE = b' \t\n\r\x0b\x0c'
+
+
+def split_file(path: str, shard_bytes: int) -> List[Tuple[int, int]]:
+    """
+    Cut a file into byte ranges that start and end between words.
+    
+    Each cut is moved forward to the next ASCII whitespace byte, so no word
+    is split across ranges. The file must use an ASCII-compatible encoding
+    such as UTF-8.
+    
+    Args:
+        path: Path of the training file
+        shard_bytes: Approximate size of each range
+        
+    Returns:
+        List of (start, end) byte offsets covering the whole file
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        target = shard_bytes
+        while target < size:
+            f.seek(target)
+            position = target
+            while True:
+                block = f.read(4096)
+                if not block:
+                    position = size
+                    break
+                cut = next((i for i, byte in enumerate(block) if byte in _WHITESPACE), -1)
+                if cut >= 0:
+                    position += cut
+                    break
+                position += len(block)
+            if position >= size:
+                break
+            bounds.append(position)
+            target = position + shard_bytes
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _read_range(path: str, start: int, end: int, encoding: str,
+                block_size: int = 1 << 20) -> Iterator[str]:
+    """Decode a byte range of a file in blocks."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield decoder.decode(block)
+    yield decoder.decode(b'', final=True)
+
+
+def _train_shard(path: str, start: int, end: int, encoding: str, order: int,
+                 tokenizer: Optional[Tokenizer]) -> ShardResult:
+    """
+    Count the transitions and sentence starters inside one byte range.
+    
+    Transitions and starter checks whose context reaches back into the
+    previous range are left to the merge step.
+    """
+    generator = BookSynopsisGenerator(order, tokenizer)
+    history: Deque[int] = deque(maxlen=order + 1)
+    head: List[str] = []
+    count = 0
+    
+    for words in iter_word_runs(_read_range(path, start, end, encoding), tokenizer):
+        if len(head) <= order:
+            head.extend(words[:order + 1 - len(head)])
+        count += len(words)
+        generator._add_words(words, history)
+    
+    tail = [generator.words[i] for i in history]
+    return (generator.words, generator.transitions, generator.sentence_starters,
+            head, tail, count)
+
+
+def _merge_shard(generator: BookSynopsisGenerator, shard: ShardResult,
+                 history: Deque[int]) -> None:
+    """
+    Stitch a shard onto the words already merged into a generator.
+    
+    Args:
+        generator: Generator holding the corpus so far
+        shard: Counts for the next range of the corpus
+        history: Ids of the last `order + 1` words merged so far; updated in place
+    """
+    words, transitions, starters, head, tail, count = shard
+    if not count:
+        return
+    order = generator.order
+    
+    # Transitions into the shard's first words, and the starter checks up to
+    # the first context inside the shard, need words the worker did not see
+    generator._add_words(head[:order], history)
+    sentence_starters = generator.sentence_starters
+    if count > order and len(history) > order:
+        flags = generator.word_flags
+        if flags[history[0]] & ENDS_SENTENCE and flags[history[1]] & CAPITALIZED:
+            context = pack_context(list(history)[1:])
+            sentence_starters[context] = sentence_starters.get(context, 0) + 1
+    
+    # Intern the shard's words in first-seen order, as a serial run would
+    mapping = [generator._intern(word) for word in words]
+    
+    def remap(key: int) -> int:
+        if order == 1:
+            return mapping[key]
+        return pack_context(mapping[i] for i in unpack_context(key, order))
+    
+    for key, successors in transitions.items():
+        merged = generator.transitions.setdefault(remap(key), {})
+        for word_id, occurrences in successors.items():
+            word_id = mapping[word_id]
+            merged[word_id] = merged.get(word_id, 0) + occurrences
+    for key, occurrences in starters.items():
+        key = remap(key)
+        sentence_starters[key] = sentence_starters.get(key, 0) + occurrences
+    
+    if count > order:
+        history.clear()
+        history.extend(generator.word_ids[word] for word in tail)
+
+
+def train_parallel(paths: Sequence[str], max_workers: Optional[int] = None,
+                   shard_bytes: int = 64 << 20, encoding: str = 'utf-8',
+                   generator: Optional[BookSynopsisGenerator] = None) -> BookSynopsisGenerator:
+    """
+    Train a generator on several files using a pool of worker processes.
+    
+    The result is identical to calling load_training_file on each path in
+    turn: every file is its own corpus, and transitions never cross from one file
+    into the next. The generator's tokenizer, if any, must be picklable. Only
+    a few shards per worker are in flight at a time, and each one's counts
+    are released once merged.
+    
+    Args:
+        paths: Training files, in order
+        max_workers: Number of worker processes (defaults to the CPU count)
+        shard_bytes: Approximate number of bytes each worker counts at a time
+        encoding: Text encoding of the files; must be ASCII-compatible
+        generator: Generator to train, or None to create a new one
+        
+    Returns:
+        The trained generator
+        
+    Raises:
+        ValueError: If the encoding is not ASCII-compatible, so the files
+            cannot be cut at whitespace bytes
+    """
+    if codecs.lookup(encoding).name not in _ASCII_COMPATIBLE:
+        raise ValueError(f"train_parallel needs an ASCII-compatible encoding, not {encoding}")
+    if generator is None:
+        generator = BookSynopsisGenerator()
+    
+    order = generator.order
+    jobs = [(number, path, start, end) for number, path in enumerate(paths)
+            for start, end in split_file(path, shard_bytes)]
+    window = 2 * (max_workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures: Deque[Future] = deque()
+        submitted = 0
+        
+        # Merge in corpus order; each file starts a fresh corpus
+        generator._begin_update()
+        current_file = None
+        history: Deque[int] = deque(maxlen=order + 1)
+        head: List[str] = []
+        for number, _, _, _ in jobs:
+            # Keep the workers busy without holding every shard's counts at once
+            while submitted < len(jobs) and len(futures) < window:
+                _, path, start, end = jobs[submitted]
+                futures.append(executor.submit(_train_shard, path, start, end, encoding,
+                                               order, generator.tokenizer))
+                submitted += 1
+            if number != current_file:
+                generator._add_first_starter(head)
+                current_file = number
+                history.clear()
+                head = []
+            shard = futures.popleft().result()
+            if len(head) < order:
+                head.extend(shard[3][:order - len(head)])
+            _merge_shard(generator, shard, history)
+        
+        # Add the first context of the last file as a potential starter
+        generator._add_first_starter(head)
+    
+    return generator
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for the compiled model
+
+Run with:
+    python -m unittest test_model
+"""
+
+import os
+import tempfile
+import unittest
+
+from book_synopsis_generator import BookSynopsisGenerator
+
+TRAINING_TEXT = "The cat sat. The dog ran far! The cat ran home? It ended here."
+
+
+class AliasTableTest(unittest.TestCase):
+    """Per-state alias tables against the successor counts."""
+    
+    def test_tables_match_counts(self):
+        """Every successor is drawn with exactly its share of the row's count."""
+        generator = BookSynopsisGenerator()
+        generator.load_training_data(TRAINING_TEXT * 3 + " The cat sat. The cat ran.")
+        model = generator.compile()
+        for state in range(model.num_states):
+            n, thresholds, lo, aliases = model.alias_table(state)
+            self.assertIsInstance(lo, int)
+            counts = model.successor_counts(state)
+            self.assertEqual(n, len(counts))
+            if not n:
+                continue
+            total = sum(counts.values())
+            mass = {}
+            for column in range(n):
+                primary = model.successors[lo + column]
+                alias = model.successors[aliases[column]]
+                mass[primary] = mass.get(primary, 0.0) + thresholds[column] / n
+                mass[alias] = mass.get(alias, 0.0) + (1 - thresholds[column]) / n
+            for word, count in counts.items():
+                self.assertAlmostEqual(mass[word], count / total, places=12)
+
+
+class CompiledCacheTest(unittest.TestCase):
+    """compile() against the generator's current settings."""
+    
+    def assertFollowsEnders(self, generator: BookSynopsisGenerator) -> None:
+        """Assert that generation matches compiling with the current enders for the first time."""
+        model = generator.compile()
+        self.assertEqual(set(model.sentence_enders), generator.sentence_enders)
+        fresh = BookSynopsisGenerator(generator.order)
+        fresh.load_training_data(TRAINING_TEXT)
+        fresh.sentence_enders = set(generator.sentence_enders)
+        self.assertEqual([generator.generate_synopsis(30, 3, rng=seed) for seed in range(20)],
+                         [fresh.generate_synopsis(30, 3, rng=seed) for seed in range(20)])
+    
+    def test_changed_enders_recompile(self):
+        """Changing sentence_enders after compiling rebuilds the model."""
+        for order in (1, 2):
+            with self.subTest(order=order):
+                generator = BookSynopsisGenerator(order)
+                generator.load_training_data(TRAINING_TEXT)
+                generator.compile()
+                generator.sentence_enders = {'!'}
+                self.assertFollowsEnders(generator)
+    
+    def test_changed_enders_after_load(self):
+        """A model loaded from a file is rebuilt from its own rows for new enders."""
+        generator = BookSynopsisGenerator(2)
+        generator.load_training_data(TRAINING_TEXT)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.bsg')
+            generator.save(path)
+            loaded = BookSynopsisGenerator.load(path, mmap=False)
+        loaded.sentence_enders = {'?', '!'}
+        self.assertFollowsEnders(loaded)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for the native sampling kernel
+
+Run with:
+    python -m unittest test_native
+"""
+
+import threading
+import unittest
+
+import synopsis_native
+from book_synopsis_generator import BookSynopsisGenerator
+
+TRAINING_TEXT = """
+The brave young warrior embarked on a perilous journey to save the kingdom.
+Against all odds, she fought against ancient evil forces that threatened the land.
+The magical sword glowed with power as she faced the dark sorcerer in battle.
+A tale of love and adventure unfolds in the mystical realm of dragons and wizards.
+The prince must rescue the princess from the tower where she has been imprisoned.
+"""
+
+
+@unittest.skipUnless(synopsis_native.available(), "no C compiler for the native kernel")
+class NativeKernelTest(unittest.TestCase):
+    """Threaded generation with the native kernel."""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.generator = BookSynopsisGenerator()
+        cls.generator.load_training_data(TRAINING_TEXT)
+    
+    def test_same_chains_for_any_thread_count(self):
+        """A seed gives the same synopses however the batch is split."""
+        expected = self.generator.generate_multiple_synopses(50, rng=3, threads=1)
+        for threads in (2, 3, 8):
+            self.assertEqual(
+                self.generator.generate_multiple_synopses(50, rng=3, threads=threads), expected)
+    
+    def test_concurrent_callers_growing_the_pool(self):
+        """Callers asking for ever larger pools at once all get their synopses."""
+        expected = {seed: self.generator.generate_multiple_synopses(20, rng=seed, threads=1)
+                    for seed in range(30)}
+        errors = []
+        mismatches = []
+        
+        def run(offset: int) -> None:
+            for seed in range(30):
+                try:
+                    synopses = self.generator.generate_multiple_synopses(
+                        20, rng=seed, threads=offset + seed % 7)
+                except Exception as error:  # Collected and reported by the test thread
+                    errors.append(error)
+                    continue
+                if synopses != expected[seed]:
+                    mismatches.append(seed)
+        
+        threads = [threading.Thread(target=run, args=(offset,)) for offset in range(1, 9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(mismatches, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
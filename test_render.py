@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the single-pass renderer
+
+CompiledModel.render and iter_render must give exactly the text that
+BookSynopsisGenerator._post_process_text makes of the space-joined words.
+Random word sequences are built from pieces that exercise every rule: inner
+'.X' breaks, leading ',;:' and sentence enders, non-ASCII case changes and
+custom, multi-character enders.
+
+Run with:
+    python -m unittest test_render
+"""
+
+import random
+import unittest
+
+from book_synopsis_generator import BookSynopsisGenerator
+from synopsis_model import CompiledModel
+
+# Pieces that words are glued together from
+PIECES = ['a', 'B', 'Zz', 'q', 'Q', '1', '.', '!', '?', ',', ':', ';', '...', 'x.', '.A', '!?B',
+          '.a', '.1', "'", '"', '-', 'é', 'É', 'ß', 'ǆ', 'İ', 'ŉ']
+
+# Sets of sentence enders, including multi-character ones and the empty suffix
+ENDER_SETS = [{'.', '!', '?'}, {'.'}, {'?', 'x'}, {'', '.'}, {'.A', 'z'}, {'ab'}, {'...', '?!'}]
+
+
+def random_words(rng: random.Random) -> list:
+    """Make a small, duplicate-free vocabulary of random words."""
+    return list({''.join(rng.choice(PIECES) for _ in range(rng.randint(1, 4)))
+                 for _ in range(rng.randint(1, 8))})
+
+
+class RenderEquivalenceTest(unittest.TestCase):
+    """render and iter_render against _post_process_text."""
+    
+    def check(self, generator: BookSynopsisGenerator, model: CompiledModel, ids: list) -> None:
+        """Assert that every rendering of the ids matches the post-processed string."""
+        expected = generator._post_process_text(' '.join(model.decode(ids)))
+        context = (model.decode(ids), sorted(model.sentence_enders))
+        self.assertEqual(model.render(ids), expected, context)
+        self.assertEqual(''.join(model.iter_render(iter(ids))), expected, context)
+        self.assertEqual(generator._render(model, ids), expected, context)
+    
+    def test_random_sequences(self):
+        """Random words and enders render exactly as post-processing does."""
+        rng = random.Random(15)
+        for _ in range(5000):
+            enders = rng.choice(ENDER_SETS)
+            words = random_words(rng)
+            generator = BookSynopsisGenerator()
+            generator.sentence_enders = set(enders)
+            model = CompiledModel(words, [0] * (len(words) + 1), [], [], [], [], tuple(enders))
+            for _ in range(4):
+                self.check(generator, model,
+                           [rng.randrange(len(words)) for _ in range(rng.randint(0, 8))])
+    
+    def test_generated_synopses(self):
+        """Walks of a trained model render as post-processing does, for any ender set."""
+        text = ("the quest began.Then Élise ran , fast ; far : away! Ça va? "
+                "oh... well ?!Who knows.Truly, the End. straße İstanbul ǆungla x.Y ab cab.")
+        rng = random.Random(5)
+        for enders in ENDER_SETS:
+            generator = BookSynopsisGenerator()
+            generator.sentence_enders = set(enders)
+            generator.load_training_data(text * 3)
+            model = generator.compile()
+            for _ in range(200):
+                ids = model.generate_ids(model.choose_start(rng), 30, 5, rng)
+                self.check(generator, model, ids)
+
+
+if __name__ == "__main__":
+    unittest.main()
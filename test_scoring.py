@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for best-of-N scoring
+
+The NumPy and pure-Python scorers must agree, top_k must rank like a stable
+sort, and every min_length the generator accepts must give usable scores.
+
+Run with:
+    python -m unittest test_scoring
+"""
+
+import math
+import random
+import unittest
+
+import synopsis_scoring
+from book_synopsis_generator import BookSynopsisGenerator, batch_rng
+
+TRAINING_TEXT = """
+The brave young warrior embarked on a perilous journey to save the kingdom.
+Against all odds, she fought against ancient evil forces that threatened the land.
+The magical sword glowed with power as she faced the dark sorcerer in battle.
+A tale of love and adventure unfolds in the mystical realm of dragons and wizards.
+The prince must rescue the princess from the tower where she has been imprisoned.
+"""
+
+
+class ScoringTest(unittest.TestCase):
+    """Scores and ranking of generated walks."""
+    
+    def without_numpy(self):
+        """Run the rest of the test on the pure-Python paths."""
+        if synopsis_scoring.np is None:
+            self.skipTest("NumPy is not installed")
+        np = synopsis_scoring.np
+        synopsis_scoring.np = None
+        self.addCleanup(setattr, synopsis_scoring, 'np', np)
+    
+    def test_top_k(self):
+        """The best k come first, ties in their order and NaN scores as -inf."""
+        nan = math.nan
+        cases = [([3.0, 1.0, 3.0, 2.0], 2, [0, 2]),
+                 ([1.0, 2.0, 2.0, 2.0, 0.5], 3, [1, 2, 3]),
+                 ([nan, 1.0, nan, -math.inf], 3, [1, 0, 2]),
+                 ([nan, nan], 2, [0, 1]),
+                 ([1.0], 5, [0]),
+                 ([1.0, 2.0], 0, [])]
+        for use_numpy in (True, False):
+            if not use_numpy:
+                self.without_numpy()
+            for scores, k, expected in cases:
+                with self.subTest(numpy=use_numpy, scores=scores, k=k):
+                    self.assertEqual(synopsis_scoring.top_k(scores, k), expected)
+    
+    def test_python_scores_match_numpy(self):
+        """Both scorers give the same components for any walks."""
+        if synopsis_scoring.np is None:
+            self.skipTest("NumPy is not installed")
+        rng = random.Random(25)
+        for order in (1, 2, 3):
+            generator = BookSynopsisGenerator(order)
+            generator.load_training_data(TRAINING_TEXT)
+            model = generator.compile()
+            chains = model.generate_batch(20, 30, 5, batch_rng(order))
+            # Walks with transitions the model lacks, and too short to have any
+            chains += [[rng.randrange(len(model.vocab)) for _ in range(rng.randint(0, 12))]
+                       for _ in range(20)]
+            for min_length, target_length in ((20, None), (-1, None), (0, None), (5, 12)):
+                with self.subTest(order=order, min_length=min_length, target=target_length):
+                    expected = synopsis_scoring.score_components(model, chains, min_length,
+                                                                 target_length)
+                    actual = synopsis_scoring._score_components_python(model, chains, min_length,
+                                                                       target_length)
+                    for name, values in expected.items():
+                        for value, other in zip(values, actual[name]):
+                            self.assertAlmostEqual(value, other, places=9, msg=name)
+    
+    def test_any_min_length(self):
+        """Negative min_length scores every walk instead of none."""
+        generator = BookSynopsisGenerator()
+        generator.load_training_data(TRAINING_TEXT)
+        model = generator.compile()
+        chains = model.generate_batch(8, 30, -1, batch_rng(1))
+        for use_numpy in (True, False):
+            if not use_numpy:
+                self.without_numpy()
+            with self.subTest(numpy=use_numpy):
+                scores = synopsis_scoring.score_chains(model, chains, min_length=-1)
+                self.assertTrue(all(math.isfinite(score) for score in scores))
+                self.assertEqual(len(generator.generate_best_synopses(
+                    k=3, candidates=8, min_length=-1, rng=5)), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tests for the HTTP server's handling of bad requests
+
+Every bad request must get a 400 and leave the server, and its batch loop,
+serving the next one.
+
+Run with:
+    python -m unittest test_server
+"""
+
+import asyncio
+import json
+import unittest
+
+from book_synopsis_generator import BookSynopsisGenerator
+from synopsis_server import SynopsisBatcher, SynopsisServer
+
+TRAINING_TEXT = "The cat sat. The dog ran far! The cat ran home. It ended here. " * 3
+
+GOOD_REQUEST = b"GET /generate?count=2&seed=5 HTTP/1.1\r\nConnection: close\r\n\r\n"
+
+
+def post(body: bytes, length: object = None) -> bytes:
+    """Build a POST /generate request, with the body's own length by default."""
+    length = len(body) if length is None else length
+    return (b"POST /generate HTTP/1.1\r\nConnection: close\r\n"
+            b"Content-Length: %s\r\n\r\n%s" % (str(length).encode(), body))
+
+
+class BadRequestTest(unittest.IsolatedAsyncioTestCase):
+    """Bad parameters, bodies and headers against a running server."""
+    
+    async def asyncSetUp(self):
+        generator = BookSynopsisGenerator()
+        generator.load_training_data(TRAINING_TEXT)
+        self.batcher = SynopsisBatcher(generator)
+        self.server = SynopsisServer(self.batcher)
+        listener = await self.server.start(port=0)
+        self.port = listener.sockets[0].getsockname()[1]
+    
+    async def asyncTearDown(self):
+        await self.server.drain(timeout=1.0)
+    
+    async def request(self, raw: bytes):
+        """Send a raw request and return the status and JSON payload of the response."""
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        try:
+            writer.write(raw)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)
+        finally:
+            writer.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        return int(head.split(b' ')[1]), json.loads(body)
+    
+    async def assertStillServing(self):
+        """Assert that a good request still gets its synopses."""
+        status, payload = await self.request(GOOD_REQUEST)
+        self.assertEqual(status, 200)
+        self.assertEqual(len(payload['synopses']), 2)
+    
+    async def test_bad_seeds(self):
+        """Seeds outside 0 to 2**64 - 1, or not integers, get a 400."""
+        for seed in ('-1', str(1 << 64), '1.5', 'abc', '1e400'):
+            with self.subTest(seed=seed):
+                status, payload = await self.request(
+                    b"GET /generate?seed=%s HTTP/1.1\r\nConnection: close\r\n\r\n"
+                    % seed.encode())
+                self.assertEqual(status, 400)
+                self.assertIn('error', payload)
+        for body in (b'{"seed": -5}', b'{"seed": 2.5}', b'{"seed": true}', b'{"seed": 1e400}'):
+            with self.subTest(body=body):
+                status, _ = await self.request(post(body))
+                self.assertEqual(status, 400)
+        status, _ = await self.request(post(b'{"seed": %d}' % ((1 << 64) - 1)))
+        self.assertEqual(status, 200)
+        await self.assertStillServing()
+    
+    async def test_bad_bodies(self):
+        """Bodies that are not JSON objects get a 400."""
+        for body in (b'[]', b'[["seed", 5]]', b'"abc"', b'5', b'null', b'{', b'\xff'):
+            with self.subTest(body=body):
+                status, payload = await self.request(post(body))
+                self.assertEqual((status, payload), (400, {'error': "body must be a JSON object"}))
+        await self.assertStillServing()
+    
+    async def test_bad_content_length(self):
+        """Negative or non-numeric Content-Length gets a 400."""
+        for length in (-5, -1, 'abc'):
+            with self.subTest(length=length):
+                status, payload = await self.request(post(b'{}', length))
+                self.assertEqual((status, payload), (400, {'error': "bad Content-Length"}))
+        await self.assertStillServing()
+    
+    async def test_failing_request_keeps_batch_loop(self):
+        """A request that fails inside the batch loop fails alone."""
+        # submit() leaves checking its parameters to the server
+        with self.assertRaises(Exception):
+            await self.batcher.submit(count=1, seed='not a seed')
+        synopses = await asyncio.wait_for(self.batcher.submit(count=3, seed=7), 5)
+        self.assertEqual(len(synopses), 3)
+        await self.assertStillServing()
+
+
+if __name__ == "__main__":
+    unittest.main()
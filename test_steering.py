@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for steered generation
+
+Walks with avoid_dead_ends or fit_length must not stop at or under
+min_length while some way forward lets them go on.
+
+Run with:
+    python -m unittest test_steering
+"""
+
+import unittest
+
+import synopsis_model
+from book_synopsis_generator import BookSynopsisGenerator
+
+# Every walk through "It ended here." runs into the dead end at the very end
+TRAINING_TEXT = "The cat sat. The dog ran far. The cat ran home. It ended here."
+
+
+class SteeringTest(unittest.TestCase):
+    """Steered walks against the dead end at the end of the corpus."""
+    
+    def test_no_early_dead_ends(self):
+        """Walks keep away from enders that lead into a dead end before min_length."""
+        for order in (1, 2):
+            generator = BookSynopsisGenerator(order)
+            generator.load_training_data(TRAINING_TEXT)
+            for fit_length in (False, True):
+                with self.subTest(order=order, fit_length=fit_length):
+                    short = [synopsis for synopsis in (
+                        generator.generate_synopsis(50, 10, rng=seed, avoid_dead_ends=True,
+                                                    fit_length=fit_length)
+                        for seed in range(500)) if len(synopsis.split()) <= 10]
+                    self.assertEqual(short, [])
+    
+    def test_walk_limits(self):
+        """Walk limits count down to the dead end and are unbounded on cycles."""
+        generator = BookSynopsisGenerator()
+        generator.load_training_data(TRAINING_TEXT)
+        model = generator.compile()
+        limits = {word: model.walk_limits()[state] for state, word in enumerate(model.vocab)}
+        self.assertEqual([limits[word] for word in ('home.', 'It', 'ended', 'here.')],
+                         [3, 2, 1, 0])
+        self.assertEqual(limits['The'], synopsis_model.UNREACHABLE)
+    
+    def test_walk_limits_without_numpy(self):
+        """The pure-Python analysis gives the NumPy one's limits."""
+        if synopsis_model.np is None:
+            self.skipTest("NumPy is not installed")
+        generator = BookSynopsisGenerator(2)
+        generator.load_training_data(TRAINING_TEXT * 3 + " The end came.")
+        model = generator.compile()
+        expected = list(model.walk_limits())
+        np, synopsis_model.np = synopsis_model.np, None
+        try:
+            self.assertEqual(list(synopsis_model.walk_limits(model.offsets, model.targets)),
+                             expected)
+        finally:
+            synopsis_model.np = np
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Equivalence tests for the training paths
+
+Every way of feeding a corpus to a generator must build exactly the model
+that load_training_data builds from the whole text: the same interned
+words, transition counts and sentence starters, and so the same synopses
+for a seed. Parallel training must match loading its files one by one,
+and a saved model must load back as the model it was saved from.
+
+Run with:
+    python -m unittest test_training
+"""
+
+import os
+import tempfile
+import unittest
+
+from book_synopsis_generator import BookSynopsisGenerator
+from synopsis_training import train_parallel
+
+TRAINING_TEXT = """
+The brave young warrior embarked on a perilous journey to save the kingdom.
+Against all odds, she fought against ancient evil forces that threatened the land.
+The magical sword glowed with power as she faced the dark sorcerer in battle.
+
+A tale of love and adventure unfolds in the mystical realm of dragons and wizards.
+Élise, the last heir, crossed the Ålands.Then the storm broke!  Who would follow?
+Evil creatures lurk in the shadows , waiting to prevent the hero from succeeding.
+"""
+
+
+def chunks(text: str, size: int):
+    """Cut text into pieces of `size` characters, splitting words anywhere."""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TrainingEquivalenceCase(unittest.TestCase):
+    """Base class with the model comparison."""
+    
+    def assertSameModel(self, actual: BookSynopsisGenerator,
+                        expected: BookSynopsisGenerator) -> None:
+        """Assert that two generators hold the same model and generate alike."""
+        self.assertEqual(actual.words, expected.words)
+        self.assertEqual(actual.transitions, expected.transitions)
+        self.assertEqual(actual.sentence_starters, expected.sentence_starters)
+        self.assertEqual(actual.generate_multiple_synopses(5, rng=7),
+                         expected.generate_multiple_synopses(5, rng=7))
+    
+    @staticmethod
+    def trained(order: int, text: str = TRAINING_TEXT) -> BookSynopsisGenerator:
+        """Train a generator on the whole text at once."""
+        generator = BookSynopsisGenerator(order)
+        generator.load_training_data(text)
+        return generator
+
+
+class ChunkedLoadingTest(TrainingEquivalenceCase):
+    """Streams, buffers and files against whole-text loading."""
+    
+    def test_stream_chunk_sizes(self):
+        """Words cut across chunk boundaries are reassembled."""
+        for order in (1, 2, 3):
+            expected = self.trained(order)
+            for size in (1, 3, 7, 64):
+                with self.subTest(order=order, size=size):
+                    generator = BookSynopsisGenerator(order)
+                    generator.load_training_stream(chunks(TRAINING_TEXT, size))
+                    self.assertSameModel(generator, expected)
+    
+    def test_stream_of_lines(self):
+        """A file-like iterable of lines loads like its text."""
+        generator = BookSynopsisGenerator(2)
+        generator.load_training_stream(TRAINING_TEXT.splitlines(keepends=True))
+        self.assertSameModel(generator, self.trained(2))
+    
+    def test_buffer_block_sizes(self):
+        """Encoded buffers decode a block at a time, even inside multi-byte characters."""
+        data = TRAINING_TEXT.encode('utf-8')
+        for order in (1, 2):
+            expected = self.trained(order)
+            for block_size in (1, 5, 13, 1 << 20):
+                with self.subTest(order=order, block_size=block_size):
+                    generator = BookSynopsisGenerator(order)
+                    generator.load_training_buffer(data, block_size=block_size)
+                    self.assertSameModel(generator, expected)
+    
+    def test_files(self):
+        """Mapped and streamed files load like their text."""
+        with tempfile.TemporaryDirectory() as directory:
+            for encoding in ('utf-8', 'latin-1', 'utf-16'):
+                path = os.path.join(directory, f"corpus.{encoding}")
+                with open(path, 'w', encoding=encoding) as f:
+                    f.write(TRAINING_TEXT)
+                for chunk_size in (5, 1 << 20):
+                    with self.subTest(encoding=encoding, chunk_size=chunk_size):
+                        generator = BookSynopsisGenerator(2)
+                        generator.load_training_file(path, encoding, chunk_size)
+                        self.assertSameModel(generator, self.trained(2))
+    
+    def test_empty_input(self):
+        """Empty chunks and files add nothing."""
+        generator = BookSynopsisGenerator()
+        generator.load_training_stream(['', '   ', '\n'])
+        self.assertEqual(generator.transitions, {})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'empty.txt')
+            open(path, 'w').close()
+            generator.load_training_file(path)
+        self.assertEqual(generator.transitions, {})
+
+
+class ParallelTrainingTest(TrainingEquivalenceCase):
+    """train_parallel against serial load_training_file."""
+    
+    def test_tiny_shards(self):
+        """Shards cut mid-word and mid-sentence merge into the serial model."""
+        parts = [TRAINING_TEXT[:200], TRAINING_TEXT[200:], "Ça va? Élise ran. " * 3, "Alone."]
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for number, part in enumerate(parts):
+                path = os.path.join(directory, f"{number}.txt")
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(part)
+                paths.append(path)
+            for order in (1, 2, 3):
+                expected = BookSynopsisGenerator(order)
+                for path in paths:
+                    expected.load_training_file(path)
+                for shard_bytes in (3, 11, 30):
+                    with self.subTest(order=order, shard_bytes=shard_bytes):
+                        generator = train_parallel(paths, max_workers=2, shard_bytes=shard_bytes,
+                                                   generator=BookSynopsisGenerator(order))
+                        self.assertSameModel(generator, expected)
+
+    def test_rejects_encodings_it_cannot_split(self):
+        """Encodings whose bytes cannot be cut at whitespace are refused up front."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'corpus.txt')
+            with open(path, 'w', encoding='utf-16') as f:
+                f.write(TRAINING_TEXT)
+            for encoding in ('utf-16', 'UTF-32-LE'):
+                with self.subTest(encoding=encoding):
+                    with self.assertRaises(ValueError):
+                        train_parallel([path], max_workers=1, encoding=encoding)
+
+
+class UpdateTest(TrainingEquivalenceCase):
+    """update() against compiling the same training data from scratch."""
+    
+    DOCUMENTS = ["The brave young warrior fought the storm. Who would follow?",
+                 "Zebras dance at dawn. The magical sword glowed again!",
+                 "Élise crossed the Ålands.Then the storm broke!",
+                 "The brave young warrior"]
+    
+    @staticmethod
+    def decoded(model) -> dict:
+        """Describe every state by its context words, counts and distances."""
+        to_ender, to_dead_end = model.distances()
+        limits = model.walk_limits()
+        states = {}
+        for state in range(model.num_states):
+            context = tuple(model.decode(model.state_words(state)))
+            counts = {model.vocab[word]: count
+                      for word, count in model.successor_counts(state).items()}
+            states[context] = (counts, to_ender[state], to_dead_end[state], limits[state])
+        starters = {}
+        previous = 0
+        for state, total in zip(model.starters, model.starter_cumulative):
+            starters[tuple(model.decode(model.state_words(state)))] = total - previous
+            previous = total
+        return {'states': states, 'starters': starters,
+                'enders': set(model.sentence_enders)}
+    
+    def test_matches_retraining(self):
+        """Patched models hold what compiling the same data from scratch gives."""
+        for order in (1, 2, 3):
+            with self.subTest(order=order):
+                generator = self.trained(order)
+                generator.compile()
+                expected = self.trained(order)
+                for document in self.DOCUMENTS:
+                    generator.update(document)
+                    expected.load_training_data(document)
+                    self.assertTrue(generator._compiled.moved)
+                    self.assertEqual(self.decoded(generator._compiled),
+                                     self.decoded(expected.compile()))
+                    self.assertEqual(generator.words, expected.words)
+                    self.assertEqual(generator.transitions, expected.transitions)
+                    self.assertEqual(generator.sentence_starters, expected.sentence_starters)
+                    self.assertEqual(self.decoded(generator._compiled.compacted()),
+                                     self.decoded(expected.compile()))
+
+
+class SaveLoadTest(unittest.TestCase):
+    """Model files against the in-memory model."""
+    
+    def assertSameCompiled(self, loaded: BookSynopsisGenerator,
+                           original: BookSynopsisGenerator) -> None:
+        """Assert that two generators hold the same compiled model and generate alike."""
+        actual, expected = loaded.compile(), original.compile()
+        self.assertEqual(list(actual.vocab), list(expected.vocab))
+        for name in ('starters', 'starter_cumulative', 'flags'):
+            self.assertEqual(list(getattr(actual, name)), list(getattr(expected, name)), name)
+        # Compare row contents: a patched model is saved with its rows compacted
+        self.assertEqual(actual.num_states, expected.num_states)
+        for state in range(expected.num_states):
+            rows = []
+            for model in (actual, expected):
+                lo, hi = model.row(state)
+                rows.append([list(array[lo:hi]) for array in
+                             (model.successors, model.targets, model.cumulative)])
+            self.assertEqual(rows[0], rows[1], state)
+        self.assertEqual(set(actual.sentence_enders), set(expected.sentence_enders))
+        self.assertEqual(tuple(map(list, actual.distances())),
+                         tuple(map(list, expected.distances())))
+        self.assertEqual(list(actual.walk_limits()), list(expected.walk_limits()))
+        self.assertEqual([loaded.generate_synopsis(rng=seed) for seed in range(20)],
+                         [original.generate_synopsis(rng=seed) for seed in range(20)])
+        self.assertEqual(loaded.generate_multiple_synopses(10, rng=3),
+                         original.generate_multiple_synopses(10, rng=3))
+    
+    def test_round_trip(self):
+        """Saved models load back unchanged, mapped or read."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.bsg')
+            for order in (1, 2, 3):
+                original = BookSynopsisGenerator(order)
+                original.sentence_enders = {'.', '!', '?', '...'}
+                original.load_training_data(TRAINING_TEXT)
+                original.save(path)
+                for use_mmap in (True, False):
+                    with self.subTest(order=order, mmap=use_mmap):
+                        self.assertSameCompiled(BookSynopsisGenerator.load(path, use_mmap),
+                                                original)
+    
+    def test_round_trip_after_update(self):
+        """Models with rows patched by update() save and load like compiled ones."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.bsg')
+            original = BookSynopsisGenerator(2)
+            original.load_training_data(TRAINING_TEXT)
+            original.compile()
+            original.update("The brave young warrior fought the storm. Who would follow?")
+            original.save(path)
+            for use_mmap in (True, False):
+                with self.subTest(mmap=use_mmap):
+                    self.assertSameCompiled(BookSynopsisGenerator.load(path, use_mmap), original)
+    
+    def test_training_a_loaded_model(self):
+        """More training on a loaded model matches training the original."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.bsg')
+            original = BookSynopsisGenerator(2)
+            original.load_training_data(TRAINING_TEXT)
+            original.save(path)
+            loaded = BookSynopsisGenerator.load(path)
+            for generator in (original, loaded):
+                generator.load_training_data("A new tale begins. The storm broke again!")
+            self.assertSameCompiled(loaded, original)
+
+
+if __name__ == "__main__":
+    unittest.main()